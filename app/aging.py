@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import case, func, select
+from app.models import Client, Invoice
+
+# Accounts-receivable aging: open invoices bucketed by days past due_date,
+# per client and currency, from one grouped CASE query. Bucket boundaries are
+# bound as dates computed here, so the query is the same on every dialect and
+# stays on the (user_id, status) index. Reports are cached per user for
+# AGING_CACHE_TTL seconds.
+
+OPEN_STATUSES = ("sent", "viewed", "overdue")
+
+# (key, label, most days past due or None for unbounded)
+BUCKETS = [
+    ("current", "Current", 0),
+    ("days_1_30", "1–30 days", 30),
+    ("days_31_60", "31–60 days", 60),
+    ("days_61_90", "61–90 days", 90),
+    ("days_90_plus", "90+ days", None),
+]
+
+AGING_CACHE_TTL = float(os.environ.get("AGING_CACHE_TTL", "60"))
+AGING_CACHE_MAX_ENTRIES = 1024
+
+def _empty_buckets():
+    return {key: 0.0 for key, _, _ in BUCKETS}
+
+def bucket_expression(as_of):
+    # due_date >= as_of - N days  <=>  at most N days past due
+    whens = [
+        (Invoice.due_date >= as_of - timedelta(days=max_days), key)
+        for key, _, max_days in BUCKETS if max_days is not None
+    ]
+    return case(*whens, else_=BUCKETS[-1][0])
+
+def build_aging_report(db, user_id, as_of):
+    bucket = bucket_expression(as_of).label("bucket")
+    rows = db.execute(
+        select(Invoice.client_id, Client.name, Invoice.currency, bucket, func.count(Invoice.id), func.sum(Invoice.total))
+        .join(Client, Invoice.client_id == Client.id)
+        .where(Invoice.user_id == user_id, Invoice.status.in_(OPEN_STATUSES))
+        .group_by(Invoice.client_id, Client.name, Invoice.currency, bucket)
+    ).all()
+
+    clients = {}
+    totals = {}
+    for client_id, name, currency, bucket_key, count, amount in rows:
+        currency = currency or "USD"
+        entry = clients.setdefault((client_id, currency), {
+            "client_id": client_id,
+            "client_name": name,
+            "currency": currency,
+            "buckets": _empty_buckets(),
+            "total": 0.0,
+            "invoice_count": 0,
+        })
+        entry["buckets"][bucket_key] += amount or 0.0
+        entry["total"] += amount or 0.0
+        entry["invoice_count"] += count
+        total = totals.setdefault(currency, {"currency": currency, "buckets": _empty_buckets(), "total": 0.0, "invoice_count": 0})
+        total["buckets"][bucket_key] += amount or 0.0
+        total["total"] += amount or 0.0
+        total["invoice_count"] += count
+
+    return {
+        "as_of": as_of.isoformat(),
+        "generated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "buckets": [{"key": key, "label": label} for key, label, _ in BUCKETS],
+        # Most overdue exposure first
+        "clients": sorted(clients.values(), key=lambda c: (-c["buckets"]["days_90_plus"], -c["total"], c["client_name"])),
+        "totals": sorted(totals.values(), key=lambda t: t["currency"]),
+    }
+
+class TTLCache:
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+_cache = TTLCache(AGING_CACHE_TTL, AGING_CACHE_MAX_ENTRIES)
+
+def aging_report(db, user_id, as_of=None):
+    as_of = as_of or date.today()
+    key = (user_id, as_of)
+    report = _cache.get(key)
+    if report is None:
+        report = build_aging_report(db, user_id, as_of)
+        _cache.set(key, report)
+    return report
@@ -0,0 +1,116 @@
+import argparse
+import os
+from datetime import date, timedelta
+from sqlalchemy import delete, func, insert, or_, select
+from app.database import engine, tenant_engines
+from app.models import Invoice, LineItem, Expense, ArchivedInvoice, ArchivedLineItem, ArchivedExpense
+from app import search
+
+# Hot/cold split for invoices, line items and expenses. Paid or cancelled
+# invoices (with their line items) and expenses older than ARCHIVE_AFTER_DAYS
+# are moved to the *_archive tables in batches, each batch in its own
+# transaction, so day-to-day pages only scan recent rows.
+#   python -m app.archive run [--before 2024-01-01] [--batch-size 500]
+#
+# Rollups are computed over hot + archive, so charts and the dashboard are
+# unaffected by a move. The JSON API reads the archive when a requested date
+# range reaches into it (see reaches_archive()). Archived rows leave the
+# full-text search index.
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "730"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVABLE_STATUSES = ("paid", "cancelled")
+
+def default_cutoff():
+    return date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+def _columns(model):
+    return [c.name for c in model.__table__.columns]
+
+def _copy(conn, source, target, where):
+    # INSERT ... SELECT the rows into the archive table
+    names = _columns(source)
+    conn.execute(
+        insert(target).from_select(names, select(*[source.__table__.c[n] for n in names]).where(where))
+    )
+
+def _move(conn, source, target, where):
+    # For tables nothing references: copy the rows, then delete them
+    _copy(conn, source, target, where)
+    conn.execute(delete(source).where(where))
+
+def archive_invoices_batch(conn, cutoff, batch_size):
+    # Archived rows keep their ids; the hot tables are AUTOINCREMENT on
+    # SQLite (see schema.AUTOINCREMENT_TABLES), so those ids are never reused
+    ids = conn.execute(
+        select(Invoice.id)
+        .where(
+            Invoice.status.in_(ARCHIVABLE_STATUSES),
+            Invoice.issue_date < cutoff,
+            or_(Invoice.paid_date.is_(None), Invoice.paid_date < cutoff),
+        )
+        .order_by(Invoice.id)
+        .limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+    # Parents are copied before their line items and deleted after them, so
+    # both foreign keys hold at every statement (Postgres checks each one)
+    _copy(conn, Invoice, ArchivedInvoice, Invoice.id.in_(ids))
+    _copy(conn, LineItem, ArchivedLineItem, LineItem.invoice_id.in_(ids))
+    conn.execute(delete(LineItem).where(LineItem.invoice_id.in_(ids)))
+    conn.execute(delete(Invoice).where(Invoice.id.in_(ids)))
+    search.delete_documents(conn, search.DOC_INVOICE, ids)
+    return len(ids)
+
+def archive_expenses_batch(conn, cutoff, batch_size):
+    ids = conn.execute(
+        select(Expense.id)
+        .where(Expense.date < cutoff)
+        .order_by(Expense.id)
+        .limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+    _move(conn, Expense, ArchivedExpense, Expense.id.in_(ids))
+    search.delete_documents(conn, search.DOC_EXPENSE, ids)
+    return len(ids)
+
+def run_archive(cutoff=None, batch_size=ARCHIVE_BATCH_SIZE, bind=None):
+    # Returns {"invoices": n, "expenses": n} moved, over every shard unless
+    # bind is given
+    cutoff = cutoff or default_cutoff()
+    moved = {"invoices": 0, "expenses": 0}
+    for tenant_bind in [bind] if bind else tenant_engines():
+        for key, archive_batch in (("invoices", archive_invoices_batch), ("expenses", archive_expenses_batch)):
+            while True:
+                with tenant_bind.begin() as conn:
+                    count = archive_batch(conn, cutoff, batch_size)
+                moved[key] += count
+                if count < batch_size:
+                    break
+    return moved
+
+def reaches_archive(db, archive_date_column, date_from, date_to):
+    # Whether a [date_from, date_to] range can include archived rows. No range
+    # at all means "current data": only the hot table is read.
+    if date_from is None and date_to is None:
+        return False
+    if date_from is None:
+        return True
+    newest = db.execute(select(func.max(archive_date_column))).scalar()
+    return newest is not None and date_from <= newest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old paid/cancelled invoices and old expenses to the archive tables")
+    parser.add_argument("command", choices=["run"])
+    parser.add_argument("--before", type=date.fromisoformat, help=f"archive rows dated before this day (default: {ARCHIVE_AFTER_DAYS} days ago)")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    from app.schema import check_schema
+    check_schema(engine)
+    # Nightly housekeeping also finishes client purges that failed partway
+    from app.purge import resume_purges
+    purged = resume_purges()
+    moved = run_archive(args.before, args.batch_size)
+    print(f"Archived {moved['invoices']} invoices and {moved['expenses']} expenses; finished {purged} client purges")
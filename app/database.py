@@ -1,19 +1,85 @@
+import hashlib
 import os
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+from app.metrics import DB_POOL_WAIT, instrument_pool
+from app import query_debug
+from app.timing import SERVER_TIMING_ENABLED, current_timings
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 if not DATABASE_URL:
     os.makedirs("/data", exist_ok=True)
     DATABASE_URL = "sqlite:////data/app.db"
 
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long each checkout waited for a connection.
+    # recreate() uses self.__class__, so this survives engine.dispose().
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
 
+# Optional sharded mode for SQLite: tenant data (everything in app.models,
+# plus the search index) lives in SQLITE_SHARDS files under SQLITE_SHARD_DIR,
+# each tenant hash-bucketed into one of them, so one tenant's writes only
+# hold their own shard's write lock. The main database keeps the auth and
+# billing tables. See app.shards for migrations and cross-shard reporting.
+SQLITE_SHARDS = int(os.environ.get("SQLITE_SHARDS", "0"))
+SQLITE_SHARD_DIR = os.environ.get("SQLITE_SHARD_DIR", "/data/shards")
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Count queries and accumulate cursor time for the current request
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    timings = current_timings.get()
+    if timings is not None:
+        timings.query_count += 1
+        timings.db_time += elapsed
+
+def make_engine(url):
+    # Every engine (main and shards) gets the same pool, metrics and hooks
+    parsed = make_url(url)
+    # In-memory SQLite needs its default single-connection pool
+    in_memory = parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+    new_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if "sqlite" in url else {},
+        poolclass=None if in_memory else TimedQueuePool
+    )
+    instrument_pool(new_engine)
+    if SERVER_TIMING_ENABLED:
+        event.listen(new_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(new_engine, "after_cursor_execute", _after_cursor_execute)
+    if query_debug.QUERY_DEBUG_ENABLED:
+        query_debug.install_engine(new_engine)
+    return new_engine
+
+engine = make_engine(DATABASE_URL)
+
+shard_engines = []
+if SQLITE_SHARDS:
+    if engine.dialect.name != "sqlite":
+        raise RuntimeError("SQLITE_SHARDS is only supported with SQLite (DATABASE_URL unset or sqlite://)")
+    os.makedirs(SQLITE_SHARD_DIR, exist_ok=True)
+    shard_engines = [
+        make_engine(f"sqlite:///{os.path.join(SQLITE_SHARD_DIR, f'tenant-{i:03d}.db')}")
+        for i in range(SQLITE_SHARDS)
+    ]
+
+# Session hooks (search, rollups, invoice owner) are registered on this
+# factory, so tenant sessions are made from it with the shard as bind
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if query_debug.QUERY_DEBUG_ENABLED:
+    query_debug.install_session(SessionLocal)
+
 Base = declarative_base()
 
 def get_db():
@@ -22,3 +88,29 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def shard_index(user_id):
+    # Stable across processes and restarts, unlike hash()
+    digest = hashlib.sha1(str(user_id).encode()).digest()
+    return int.from_bytes(digest[:8], "big") % SQLITE_SHARDS
+
+def tenant_engine(user_id):
+    return shard_engines[shard_index(user_id)] if shard_engines else engine
+
+def tenant_engines():
+    # Every database holding tenant data, for jobs that cover all tenants
+    return shard_engines or [engine]
+
+def all_engines():
+    return [engine] + shard_engines
+
+def tenant_session(user_id):
+    return SessionLocal(bind=tenant_engine(user_id))
+
+def insert_ignoring_conflicts(bind, model):
+    # INSERT ... ON CONFLICT DO NOTHING for the bound dialect (SQLite or Postgres)
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model).on_conflict_do_nothing()
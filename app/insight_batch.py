@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import exists, func, insert, or_, select, update
+from starlette.requests import Request
+import app.routes as routes_module
+from app.database import SessionLocal, tenant_engines
+from app.insight_context import INSIGHT_TYPES, build_prompt
+from app.llm import get_provider, generate_insight
+from app.purge import TOMBSTONE_PREFIX
+from app.models import Client, Invoice, Expense, FinancialInsight, InsightBatchRun, InsightBatchItem
+
+# Nightly precomputation of the standard insights for every active subscriber,
+# so the insights page serves stored results instead of waiting on the model.
+# Run it from cron / a scheduled container:
+#   python -m app.insight_batch --concurrency 4 --max-calls 2000 --calls-per-minute 60
+#
+# Each run writes one insight_batch_items row per (tenant, insight type) up
+# front. Items whose source data fingerprint matches the tenant's last
+# successful item are marked "skipped"; the rest are "pending" until a worker
+# stores the insight and marks them "done" in the same transaction. A run that
+# crashed (or stopped at --max-calls) is left "running" and the next invocation
+# resumes its pending items instead of starting over. Workers lease an item
+# (locked_until) before calling the model, so overlapping invocations never
+# generate the same item twice. With SQLite sharding
+# every shard keeps its own runs next to its tenants' data; one invocation
+# covers all of them with a shared worker pool, rate limit and --max-calls.
+
+BATCH_INSIGHT_TYPES = list(INSIGHT_TYPES)
+
+# Which source tables each insight type reads (see app.insight_context)
+INSIGHT_SOURCES = {
+    "revenue_forecast": ("invoices",),
+    "expense_analysis": ("expenses",),
+    "cash_flow": ("invoices", "expenses"),
+    "client_summary": ("clients", "invoices"),
+}
+
+BATCH_CONCURRENCY = int(os.environ.get("INSIGHT_BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CALLS = int(os.environ.get("INSIGHT_BATCH_MAX_CALLS", "0")) # 0 = unlimited
+BATCH_CALLS_PER_MINUTE = float(os.environ.get("INSIGHT_BATCH_CALLS_PER_MINUTE", "60"))
+# How long a worker may take over one item before another invocation may retry it
+BATCH_LEASE_SECONDS = int(os.environ.get("INSIGHT_BATCH_LEASE_SECONDS", "600"))
+
+logger = logging.getLogger("app.insight_batch")
+
+class RateLimiter:
+    # Spaces call starts evenly across all worker threads
+    def __init__(self, calls_per_minute):
+        self.interval = 60.0 / calls_per_minute if calls_per_minute else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def _source_stats(db):
+    # {source: {user_id: stats tuple}}, one grouped query per table. Counts and
+    # max ids catch inserts/deletes, sums and max(updated_at) catch edits.
+    stats = {"clients": {}, "invoices": {}, "expenses": {}}
+    for row in db.execute(
+        select(Client.user_id, func.count(Client.id), func.max(Client.id), func.max(Client.updated_at))
+        .group_by(Client.user_id)
+    ):
+        stats["clients"][row[0]] = tuple(row[1:])
+    for row in db.execute(
+        select(Invoice.user_id, func.count(Invoice.id), func.max(Invoice.id), func.max(Invoice.updated_at), func.sum(Invoice.total))
+        .group_by(Invoice.user_id)
+    ):
+        stats["invoices"][row[0]] = tuple(row[1:])
+    for row in db.execute(
+        select(Expense.user_id, func.count(Expense.id), func.max(Expense.id), func.max(Expense.updated_at), func.sum(Expense.amount))
+        .group_by(Expense.user_id)
+    ):
+        stats["expenses"][row[0]] = tuple(row[1:])
+    return stats
+
+def fingerprint(stats, user_id, insight_type):
+    parts = [repr(stats[source].get(user_id)) for source in INSIGHT_SOURCES[insight_type]]
+    return hashlib.sha256("|".join([insight_type] + parts).encode()).hexdigest()
+
+async def _has_subscription(user_id):
+    # The same check app.main's require_active_subscription makes per request:
+    # viv-pay's require_subscription raises when the user has no active
+    # subscription. Anything unexpected counts as inactive, so an unknown
+    # billing state never turns into model spend.
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+    try:
+        await routes_module.require_subscription(request, user_id=user_id)
+    except HTTPException:
+        return False
+    except Exception:
+        logger.exception("Subscription check failed for %s", user_id)
+        return False
+    return True
+
+def active_subscribers(user_ids):
+    # require_subscription comes from viv-pay (wired up by app.main); without
+    # billing configured every tenant counts as active
+    if routes_module.require_subscription is None:
+        return list(user_ids)
+    async def check_all():
+        return [user_id for user_id in user_ids if await _has_subscription(user_id)]
+    return asyncio.run(check_all())
+
+def _queue_run(db, insight_types):
+    # Start a new run: one item per (active tenant, insight type)
+    stats = _source_stats(db)
+    tenants = sorted(set(stats["clients"]) | set(stats["expenses"]))
+    # Owners of clients pending purge are not tenants (see app.purge)
+    tenants = active_subscribers([user_id for user_id in tenants if not user_id.startswith(TOMBSTONE_PREFIX)])
+
+    last_done = {}
+    for user_id, insight_type, data_fingerprint in db.execute(
+        select(InsightBatchItem.user_id, InsightBatchItem.insight_type, InsightBatchItem.data_fingerprint)
+        .where(InsightBatchItem.status == "done")
+        .order_by(InsightBatchItem.id)
+    ):
+        last_done[(user_id, insight_type)] = data_fingerprint
+
+    run = InsightBatchRun(status="running")
+    db.add(run)
+    db.flush()
+    rows = []
+    for user_id in tenants:
+        for insight_type in insight_types:
+            data_fingerprint = fingerprint(stats, user_id, insight_type)
+            unchanged = last_done.get((user_id, insight_type)) == data_fingerprint
+            rows.append({
+                "run_id": run.id,
+                "user_id": user_id,
+                "insight_type": insight_type,
+                "data_fingerprint": data_fingerprint,
+                "status": "skipped" if unchanged else "pending",
+            })
+    for i in range(0, len(rows), 1000):
+        db.execute(insert(InsightBatchItem), rows[i:i + 1000])
+    db.commit()
+    return run.id
+
+def claim_item(db, item_id):
+    # Lease a pending item; False when it's finished or another worker holds it.
+    # A crashed worker's lease expires and the item is picked up again.
+    now = datetime.utcnow()
+    claimed = db.execute(
+        update(InsightBatchItem)
+        .where(
+            InsightBatchItem.id == item_id,
+            InsightBatchItem.status == "pending",
+            or_(InsightBatchItem.locked_until.is_(None), InsightBatchItem.locked_until < now),
+        )
+        .values(locked_until=now + timedelta(seconds=BATCH_LEASE_SECONDS))
+    )
+    db.commit()
+    return claimed.rowcount == 1
+
+def _process_item(provider, limiter, bind, item_id):
+    db = SessionLocal(bind=bind)
+    try:
+        if not claim_item(db, item_id):
+            return "claimed"
+        item = db.get(InsightBatchItem, item_id)
+        prompt = build_prompt(db, item.user_id, item.insight_type)
+        limiter.wait()
+        try:
+            generation = generate_insight(provider, prompt, item.insight_type)
+        except Exception as e:
+            item.status = "failed"
+            item.error = str(e)[:1000]
+            item.locked_until = None
+            db.commit()
+            logger.warning("Insight %s for %s failed: %s", item.insight_type, item.user_id, e)
+            return item.status
+        insight = FinancialInsight(
+            insight_type=item.insight_type,
+            body=generation.text,
+            model_used=generation.model,
+            requested_by=item.user_id
+        )
+        db.add(insight)
+        db.flush()
+        item.insight_id = insight.id
+        item.status = "done"
+        item.error = None
+        item.locked_until = None
+        db.commit()
+        return item.status
+    finally:
+        db.close()
+
+def _prepare_run(bind, insight_types):
+    # Returns (run id, pending item ids) for one database, resuming its
+    # unfinished run if there is one
+    db = SessionLocal(bind=bind)
+    try:
+        run_id = db.execute(
+            select(InsightBatchRun.id).where(InsightBatchRun.status == "running").order_by(InsightBatchRun.id.desc()).limit(1)
+        ).scalar()
+        if run_id is None:
+            run_id = _queue_run(db, insight_types)
+            logger.info("Started insight batch run %s", run_id)
+        else:
+            logger.info("Resuming insight batch run %s", run_id)
+        pending = db.execute(
+            select(InsightBatchItem.id)
+            .where(InsightBatchItem.run_id == run_id, InsightBatchItem.status == "pending")
+            .order_by(InsightBatchItem.id)
+        ).scalars().all()
+    finally:
+        db.close()
+    return run_id, pending
+
+def run_batch(concurrency=BATCH_CONCURRENCY, max_calls=BATCH_MAX_CALLS, calls_per_minute=BATCH_CALLS_PER_MINUTE, insight_types=None):
+    insight_types = insight_types or BATCH_INSIGHT_TYPES
+    provider = get_provider()
+    provider.ensure_ready()
+
+    runs = [(bind, *_prepare_run(bind, insight_types)) for bind in tenant_engines()]
+    work = [(bind, item_id) for bind, _, pending in runs for item_id in pending]
+    todo = work[:max_calls] if max_calls else work
+    limiter = RateLimiter(calls_per_minute)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda task: _process_item(provider, limiter, *task), todo))
+
+    summary = {"run_ids": [run_id for _, run_id, _ in runs], "processed": len(results), "remaining": len(work) - len(todo)}
+    for status in ("done", "failed"):
+        summary[status] = results.count(status)
+
+    # A run is complete once no item is pending, whichever invocation did them
+    for bind, run_id, _ in runs:
+        pending = exists().where(InsightBatchItem.run_id == run_id, InsightBatchItem.status == "pending")
+        with SessionLocal(bind=bind) as db:
+            db.execute(
+                update(InsightBatchRun)
+                .where(InsightBatchRun.id == run_id, ~pending)
+                .values(status="completed", finished_at=func.now())
+            )
+            db.commit()
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute insights for all active subscribers")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="parallel model calls")
+    parser.add_argument("--max-calls", type=int, default=BATCH_MAX_CALLS, help="stop after this many model calls (0 = no limit); the rest resumes next run")
+    parser.add_argument("--calls-per-minute", type=float, default=BATCH_CALLS_PER_MINUTE, help="rate limit across all workers (0 = none)")
+    parser.add_argument("--type", dest="insight_types", action="append", choices=BATCH_INSIGHT_TYPES, help="only these insight types (repeatable)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # Importing the app wires up viv-pay, which is needed to check subscriptions
+    import app.main
+    from app.schema import check_schema
+    check_schema(app.main.engine)
+    summary = run_batch(args.concurrency, args.max_calls, args.calls_per_minute, args.insight_types)
+    print(f"Runs {', '.join(map(str, summary['run_ids']))}: {summary['done']} generated, {summary['failed']} failed, {summary['remaining']} left for the next run")
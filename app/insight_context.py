@@ -0,0 +1,316 @@
+import os
+from datetime import date, timedelta
+from typing import Literal, get_args
+from sqlalchemy import case, func, select, union_all
+from app.models import Client, Invoice, Expense, ArchivedExpense, MonthlyRollup
+from app.archive import reaches_archive
+from app.aging import OPEN_STATUSES
+from app import rollups
+
+# Prompt context for insights. Instead of raw rows, the model gets aggregates
+# over the tenant's full history: monthly totals from the rollups table,
+# per-category and per-client splits, payment-delay statistics from grouped
+# queries over hot and archived invoices, and a few notable rows. Everything
+# is rendered as compact CSV sections and trimmed to INSIGHT_CONTEXT_TOKENS.
+#
+# Amounts are summed across currencies, as in the rollups.
+
+INSIGHT_CONTEXT_TOKENS = int(os.environ.get("INSIGHT_CONTEXT_TOKENS", "3000"))
+NOTABLE_ROWS = int(os.environ.get("INSIGHT_CONTEXT_NOTABLE_ROWS", "10"))
+MONTHLY_DETAIL_MONTHS = 24 # older history is folded into yearly totals
+CHARS_PER_TOKEN = 4 # rough estimate for English text and numbers
+
+# The insight types build_context knows. Requests are validated against this
+# before the type reaches a prompt or a metric label.
+InsightType = Literal["revenue_forecast", "expense_analysis", "cash_flow", "client_summary"]
+INSIGHT_TYPES = get_args(InsightType)
+
+class Section:
+    # A titled CSV table. When the context is over budget, lines are dropped
+    # from the less important end (the oldest months, the smallest balances)
+    # down to min_lines.
+    def __init__(self, title, header, lines, drop_from_start=False, min_lines=1):
+        self.title = title
+        self.header = header
+        self.lines = lines
+        self.drop_from_start = drop_from_start
+        self.min_lines = min_lines
+        self.omitted = 0
+
+    def drop_line(self):
+        self.omitted += 1
+        return self.lines.pop(0 if self.drop_from_start else -1)
+
+    def render(self):
+        parts = [f"## {self.title}", self.header] + self.lines
+        if self.omitted:
+            parts.append(f"({self.omitted} more rows omitted)")
+        return "\n".join(parts)
+
+def _render(sections):
+    return "\n\n".join(section.render() for section in sections)
+
+def fit_to_budget(sections, budget):
+    # Sections are in priority order; trim the last ones first, then drop
+    # whole sections if the minimums alone don't fit
+    sections = [section for section in sections if section.lines]
+    max_chars = budget * CHARS_PER_TOKEN
+    for section in reversed(sections):
+        excess = len(_render(sections)) - max_chars
+        if excess <= 0:
+            break
+        excess += 30 # room for the "rows omitted" note
+        while excess > 0 and len(section.lines) > section.min_lines:
+            excess -= len(section.drop_line()) + 1
+    while sections and len(_render(sections)) > max_chars:
+        sections.pop()
+    return _render(sections)
+
+def _money(value):
+    return f"{value or 0.0:.2f}"
+
+def _csv(*values):
+    # Commas inside names would shift columns
+    return ",".join(str(v).replace(",", " ") if v is not None else "" for v in values)
+
+def _days_between(db, later, earlier):
+    if db.get_bind().dialect.name == "sqlite":
+        return func.julianday(later) - func.julianday(earlier)
+    return later - earlier # date - date is an integer day count on Postgres
+
+def _rollup_totals(db, user_id, metrics):
+    # {month: {metric: amount}} over the whole history
+    months = {}
+    for month, metric, amount in db.execute(
+        select(MonthlyRollup.month, MonthlyRollup.metric, MonthlyRollup.amount).where(
+            MonthlyRollup.user_id == user_id,
+            MonthlyRollup.dimension == rollups.TOTAL,
+            MonthlyRollup.metric.in_(metrics),
+        )
+    ):
+        months.setdefault(month, {})[metric] = amount or 0.0
+    return months
+
+def monthly_sections(db, user_id, metrics, today):
+    months = _rollup_totals(db, user_id, metrics)
+    detail_start = rollups.add_months(rollups.month_start(today), -(MONTHLY_DETAIL_MONTHS - 1))
+    years = {}
+    for month, values in months.items():
+        if month < detail_start:
+            year = years.setdefault(month.year, {})
+            for metric, amount in values.items():
+                year[metric] = year.get(metric, 0.0) + amount
+    header = _csv("period", *metrics)
+    yearly = Section(
+        "Yearly totals (before the monthly detail)", header,
+        [_csv(year, *[_money(years[year].get(m)) for m in metrics]) for year in sorted(years)],
+        drop_from_start=True,
+    )
+    monthly = Section(
+        f"Monthly totals (last {MONTHLY_DETAIL_MONTHS} months)", header,
+        [
+            _csv(month.strftime("%Y-%m"), *[_money(months[month].get(m)) for m in metrics])
+            for month in sorted(months) if month >= detail_start
+        ],
+        drop_from_start=True, min_lines=6,
+    )
+    return [monthly, yearly]
+
+def expense_category_section(db, user_id, today):
+    recent_start = rollups.add_months(rollups.month_start(today), -11)
+    recent = func.sum(case((MonthlyRollup.month >= recent_start, MonthlyRollup.amount), else_=0.0))
+    rows = db.execute(
+        select(MonthlyRollup.dimension, func.sum(MonthlyRollup.amount), recent)
+        .where(
+            MonthlyRollup.user_id == user_id,
+            MonthlyRollup.metric == rollups.EXPENSES,
+            MonthlyRollup.dimension.like("category:%"),
+        )
+        .group_by(MonthlyRollup.dimension)
+        .order_by(func.sum(MonthlyRollup.amount).desc())
+    ).all()
+    return Section(
+        "Expenses by category", _csv("category", "all_time", "last_12_months"),
+        [_csv(dimension[len("category:"):], _money(total), _money(last_12)) for dimension, total, last_12 in rows],
+    )
+
+def payment_delay_stats(db, user_id):
+    # {client_id: [paid count, sum of days to pay, paid late count, sum of days late, max days late]}
+    stats = {}
+    for model in rollups.INVOICE_SOURCES:
+        days_to_pay = _days_between(db, model.paid_date, model.issue_date)
+        days_late = _days_between(db, model.paid_date, model.due_date)
+        rows = db.execute(
+            select(
+                model.client_id,
+                func.count(model.id),
+                func.sum(days_to_pay),
+                func.sum(case((days_late > 0, 1), else_=0)),
+                func.sum(case((days_late > 0, days_late), else_=0)),
+                func.max(days_late),
+            )
+            .where(model.user_id == user_id, model.status == "paid", model.paid_date.isnot(None))
+            .group_by(model.client_id)
+        )
+        for client_id, count, to_pay, late_count, late_days, max_late in rows:
+            entry = stats.setdefault(client_id, [0, 0.0, 0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += to_pay or 0.0
+            entry[2] += late_count or 0
+            entry[3] += late_days or 0.0
+            entry[4] = max(entry[4], max_late or 0.0)
+    return stats
+
+def payment_delay_section(stats):
+    count = sum(s[0] for s in stats.values())
+    if not count:
+        return Section("Payment timing (paid invoices)", "", [])
+    late = sum(s[2] for s in stats.values())
+    return Section(
+        "Payment timing (paid invoices)",
+        _csv("paid_invoices", "avg_days_to_pay", "paid_late_share", "avg_days_late_when_late", "max_days_late"),
+        [_csv(
+            count,
+            f"{sum(s[1] for s in stats.values()) / count:.1f}",
+            f"{late / count:.2f}",
+            f"{sum(s[3] for s in stats.values()) / late:.1f}" if late else "0",
+            f"{max(s[4] for s in stats.values()):.0f}",
+        )],
+    )
+
+def client_balance_section(db, user_id, today, delays=None):
+    clients = dict(db.execute(select(Client.id, Client.name).where(Client.user_id == user_id)).all())
+    totals = {}
+    for dimension, metric, amount in db.execute(
+        select(MonthlyRollup.dimension, MonthlyRollup.metric, func.sum(MonthlyRollup.amount))
+        .where(
+            MonthlyRollup.user_id == user_id,
+            MonthlyRollup.metric.in_([rollups.INVOICED, rollups.REVENUE]),
+            MonthlyRollup.dimension.like("client:%"),
+        )
+        .group_by(MonthlyRollup.dimension, MonthlyRollup.metric)
+    ):
+        totals.setdefault(int(dimension[len("client:"):]), {})[metric] = amount or 0.0
+    # Open invoices are never archived, so the hot table has every balance
+    open_balances = {
+        client_id: (outstanding or 0.0, overdue or 0.0, count)
+        for client_id, outstanding, overdue, count in db.execute(
+            select(
+                Invoice.client_id,
+                func.sum(Invoice.total),
+                func.sum(case((Invoice.due_date < today, Invoice.total), else_=0.0)),
+                func.count(Invoice.id),
+            )
+            .where(Invoice.user_id == user_id, Invoice.status.in_(OPEN_STATUSES))
+            .group_by(Invoice.client_id)
+        )
+    }
+
+    columns = ["client", "invoiced", "paid", "outstanding", "overdue", "open_invoices"]
+    if delays is not None:
+        columns += ["avg_days_to_pay", "paid_late_share"]
+    rows = []
+    for client_id, name in clients.items():
+        invoiced = totals.get(client_id, {}).get(rollups.INVOICED, 0.0)
+        paid = totals.get(client_id, {}).get(rollups.REVENUE, 0.0)
+        outstanding, overdue, open_count = open_balances.get(client_id, (0.0, 0.0, 0))
+        values = [name, _money(invoiced), _money(paid), _money(outstanding), _money(overdue), open_count]
+        if delays is not None:
+            stats = delays.get(client_id)
+            values += [f"{stats[1] / stats[0]:.1f}", f"{stats[2] / stats[0]:.2f}"] if stats and stats[0] else ["", ""]
+        rows.append(((overdue, outstanding, invoiced), _csv(*values)))
+    rows.sort(key=lambda row: row[0], reverse=True)
+    return Section("Clients (largest overdue and outstanding first)", _csv(*columns), [line for _, line in rows], min_lines=3)
+
+def receivables_section(db, user_id, today):
+    outstanding, overdue, count = db.execute(
+        select(
+            func.sum(Invoice.total),
+            func.sum(case((Invoice.due_date < today, Invoice.total), else_=0.0)),
+            func.count(Invoice.id),
+        ).where(Invoice.user_id == user_id, Invoice.status.in_(OPEN_STATUSES))
+    ).one()
+    return Section(
+        "Open receivables", _csv("open_invoices", "outstanding", "overdue"),
+        [_csv(count, _money(outstanding), _money(overdue))] if count else [],
+    )
+
+def open_invoice_section(db, user_id, today, title, order_by, overdue_only=False):
+    query = (
+        select(Invoice.invoice_number, Client.name, Invoice.status, Invoice.total, Invoice.currency, Invoice.issue_date, Invoice.due_date)
+        .join(Client, Invoice.client_id == Client.id)
+        .where(Invoice.user_id == user_id, Invoice.status.in_(OPEN_STATUSES))
+    )
+    if overdue_only:
+        query = query.where(Invoice.due_date < today)
+    rows = db.execute(query.order_by(order_by).limit(NOTABLE_ROWS)).all()
+    return Section(
+        title, _csv("invoice", "client", "status", "total", "currency", "issued", "due"),
+        [_csv(r.invoice_number, r.name, r.status, _money(r.total), r.currency, r.issue_date, r.due_date) for r in rows],
+    )
+
+def large_expense_section(db, user_id, today):
+    # ARCHIVE_AFTER_DAYS can be shorter than the window, so the archive is
+    # read too when it holds expenses from the last 12 months
+    start = today - timedelta(days=365)
+    models = [Expense]
+    if reaches_archive(db, ArchivedExpense.date, start, today):
+        models.append(ArchivedExpense)
+    expenses = union_all(*[
+        select(model.date, model.category, model.vendor, model.description, model.amount, model.currency)
+        .where(model.user_id == user_id, model.date >= start)
+        for model in models
+    ]).subquery()
+    rows = db.execute(select(expenses).order_by(expenses.c.amount.desc()).limit(NOTABLE_ROWS)).all()
+    return Section(
+        "Largest expenses (last 12 months)", _csv("date", "category", "vendor", "description", "amount", "currency"),
+        [_csv(r.date, r.category, r.vendor, r.description, _money(r.amount), r.currency) for r in rows],
+    )
+
+def build_context(db, user_id, insight_type, budget=INSIGHT_CONTEXT_TOKENS, today=None):
+    today = today or date.today()
+    sections = []
+    if insight_type == "revenue_forecast":
+        sections += monthly_sections(db, user_id, [rollups.REVENUE, rollups.INVOICED], today)
+        sections.append(receivables_section(db, user_id, today))
+        sections.append(payment_delay_section(payment_delay_stats(db, user_id)))
+        sections.append(open_invoice_section(db, user_id, today, "Largest open invoices", Invoice.total.desc()))
+
+    elif insight_type == "expense_analysis":
+        sections += monthly_sections(db, user_id, [rollups.EXPENSES], today)
+        sections.append(expense_category_section(db, user_id, today))
+        sections.append(large_expense_section(db, user_id, today))
+
+    elif insight_type == "cash_flow":
+        sections += monthly_sections(db, user_id, [rollups.REVENUE, rollups.INVOICED, rollups.EXPENSES], today)
+        sections.append(receivables_section(db, user_id, today))
+        sections.append(payment_delay_section(payment_delay_stats(db, user_id)))
+        sections.append(open_invoice_section(db, user_id, today, "Most overdue invoices", Invoice.due_date, overdue_only=True))
+        sections.append(large_expense_section(db, user_id, today))
+
+    elif insight_type == "client_summary":
+        delays = payment_delay_stats(db, user_id)
+        sections.append(client_balance_section(db, user_id, today, delays))
+        sections.append(payment_delay_section(delays))
+        sections.append(open_invoice_section(db, user_id, today, "Most overdue invoices", Invoice.due_date, overdue_only=True))
+
+    else:
+        raise ValueError(f"Unknown insight type: {insight_type}")
+
+    return fit_to_budget(sections, budget)
+
+def build_prompt(db, user_id, insight_type):
+    today = date.today()
+    context_data = build_context(db, user_id, insight_type, today=today)
+
+    prompt = f"""
+    You are a financial analyst AI for an invoice management application.
+    Analyze the provided data and generate a '{insight_type}'.
+    Provide actionable insights, trends, and recommendations.
+    Keep the tone professional but accessible.
+    The data covers the complete history as CSV tables; amounts are summed across currencies. Today is {today.isoformat()}.
+
+    Data:
+    {context_data}
+    """
+    return prompt
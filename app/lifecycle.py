@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+import resource
+import time
+from contextlib import asynccontextmanager
+from app.database import all_engines, engine
+from app.schema import check_schema
+from app.templating import templates
+from app import metrics, webhooks
+
+logger = logging.getLogger("app.lifecycle")
+
+# Connections opened per worker before it starts serving
+POOL_WARM_CONNECTIONS = int(os.environ.get("DB_POOL_WARM_CONNECTIONS", "2"))
+
+def warm_pool(engine, count):
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.connect())
+    finally:
+        for conn in connections:
+            conn.close()
+
+def compile_templates():
+    # Load every template into the shared environment's cache so the first
+    # request for each page doesn't pay for parsing and compiling it
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.env.get_template(name)
+
+def peak_rss_bytes():
+    # ru_maxrss is kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+@asynccontextmanager
+async def lifespan(app):
+    started = time.perf_counter()
+    # gunicorn.conf.py runs the schema check once in the master before forking
+    if not os.environ.get("SCHEMA_CHECKED"):
+        check_schema(engine)
+    warm_pool(engine, POOL_WARM_CONNECTIONS)
+    compile_templates()
+    # Keep handlers registered by libraries with app.on_event() working;
+    # Starlette skips them once a lifespan is set
+    await app.router.startup()
+    # Optional in-process outbox dispatcher; leases keep workers from sending
+    # the same delivery twice
+    dispatcher_stop = asyncio.Event()
+    dispatcher = None
+    if webhooks.WEBHOOK_DISPATCH_IN_APP and webhooks.WEBHOOK_ENDPOINTS:
+        dispatcher = asyncio.create_task(webhooks.run_dispatcher(dispatcher_stop))
+
+    startup_seconds = time.perf_counter() - started
+    metrics.STARTUP_SECONDS.set(startup_seconds)
+    metrics.WORKER_PEAK_RSS.set(peak_rss_bytes())
+    logger.info("worker %s ready in %.0f ms, peak RSS %.1f MB", os.getpid(), startup_seconds * 1000, peak_rss_bytes() / 1048576)
+    try:
+        yield
+    finally:
+        if dispatcher is not None:
+            dispatcher_stop.set()
+            await dispatcher
+        await app.router.shutdown()
+        # In-flight requests have drained by the time the server runs shutdown
+        for db_engine in all_engines():
+            db_engine.dispose()
+        logger.info("worker %s stopped", os.getpid())
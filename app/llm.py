@@ -0,0 +1,133 @@
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Optional
+from app import metrics
+
+# Insight text generation behind a small provider interface.
+#   INSIGHT_PROVIDER=gemini (default)  Google Gemini via google-genai
+#   INSIGHT_PROVIDER=stub              deterministic offline output, for tests
+#                                      and benchmarks
+# The Gemini SDK is imported on first use rather than at app import, and one
+# client (with its HTTP connection pool) is reused per process.
+
+class ProviderNotConfigured(Exception):
+    pass
+
+@dataclass
+class Generation:
+    text: str
+    model: str
+    usage: Optional[Any] = None # provider usage metadata (prompt/candidates token counts)
+
+class InsightProvider(ABC):
+    # Subclasses must implement generate(); one that doesn't fails when it is
+    # instantiated rather than on the first request
+    model = None
+
+    def ensure_ready(self):
+        # Raise ProviderNotConfigured before any context is built for a call
+        pass
+
+    @abstractmethod
+    def generate(self, prompt):
+        # Returns a Generation
+        ...
+
+    def stream(self, prompt):
+        # Yields Generation chunks as they arrive; usage is set on the chunk
+        # that carries it (usually the last). Non-streaming fallback:
+        yield self.generate(prompt)
+
+class GeminiProvider(InsightProvider):
+    def __init__(self, model=None):
+        self.model = model or os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    api_key = os.environ.get("GOOGLE_API_KEY")
+                    if not api_key:
+                        raise ProviderNotConfigured("Google API Key not configured")
+                    from google import genai
+                    self._client = genai.Client(api_key=api_key)
+        return self._client
+
+    def ensure_ready(self):
+        self.client()
+
+    def generate(self, prompt):
+        response = self.client().models.generate_content(model=self.model, contents=prompt)
+        return Generation(response.text, self.model, getattr(response, "usage_metadata", None))
+
+    def stream(self, prompt):
+        for chunk in self.client().models.generate_content_stream(model=self.model, contents=prompt):
+            yield Generation(chunk.text or "", self.model, getattr(chunk, "usage_metadata", None))
+
+class StubProvider(InsightProvider):
+    model = "stub"
+
+    def __init__(self, chunk_delay=None):
+        # Optional pause between streamed chunks to mimic a real model
+        self.chunk_delay = float(os.environ.get("STUB_STREAM_DELAY", "0")) if chunk_delay is None else chunk_delay
+
+    def stream(self, prompt):
+        generation = self.generate(prompt)
+        lines = generation.text.splitlines(keepends=True)
+        for i, line in enumerate(lines):
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield Generation(line, self.model, generation.usage if i == len(lines) - 1 else None)
+
+    def generate(self, prompt):
+        # Same prompt, same output: stable for assertions and snapshots
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        text = (
+            f"Summary ({digest})\n\n"
+            f"This is an offline insight generated from {len(prompt)} characters of context.\n"
+            "- Revenue: review outstanding invoices and follow up on overdue ones.\n"
+            "- Expenses: check recurring software costs for unused seats.\n"
+            "- Cash flow: keep at least two months of expenses in reserve."
+        )
+        usage = SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+        return Generation(text, self.model, usage)
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "stub": StubProvider,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                name = os.environ.get("INSIGHT_PROVIDER", "gemini").lower()
+                if name not in PROVIDERS:
+                    raise ProviderNotConfigured(f"Unknown INSIGHT_PROVIDER '{name}'")
+                _provider = PROVIDERS[name]()
+    return _provider
+
+def generate_insight(provider, prompt, insight_type):
+    # provider.generate() with latency, error and token metrics recorded
+    labels = {"model": provider.model, "insight_type": insight_type}
+    start = time.perf_counter()
+    try:
+        generation = provider.generate(prompt)
+    except Exception:
+        metrics.LLM_ERRORS.labels(**labels).inc()
+        raise
+    finally:
+        metrics.LLM_LATENCY.labels(**labels).observe(time.perf_counter() - start)
+    metrics.record_llm_usage(generation.model, generation.usage)
+    return generation
@@ -1,20 +1,90 @@
+import json
+import logging
+import time
 from fastapi import FastAPI, Depends, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
 from app.database import engine, Base, get_db
+from app import metrics, query_debug
+from app.timing import SERVER_TIMING_ENABLED, RequestTimings, current_timings
 import app.routes as routes_module
-from app.routes import dashboard, invoices, clients, expenses, insights, billing
+from app.routes import dashboard, invoices, clients, expenses, insights, billing, api_v1, charts, recurring, reports, search as search_routes
+from app.lifecycle import lifespan, peak_rss_bytes
 # Start imports for viv-auth and viv-pay
 from viv_auth import init_auth
 from viv_pay import init_pay
 
-app = FastAPI(title="Invoice Manager", description="AI-powered invoice and expense management")
+app = FastAPI(title="Invoice Manager", description="AI-powered invoice and expense management", lifespan=lifespan)
 
 # Health check (must be first)
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render_metrics(), headers={"Content-Type": metrics.CONTENT_TYPE_LATEST})
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        # Label by route template (/invoices/{id}), not the raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "<unmatched>")
+        metrics.REQUEST_LATENCY.labels(method=request.method, route=route_path).observe(time.perf_counter() - start)
+        metrics.REQUEST_COUNT.labels(method=request.method, route=route_path, status=str(status_code)).inc()
+        metrics.WORKER_PEAK_RSS.set(peak_rss_bytes())
+
+# Per-request Server-Timing header + structured log line (SERVER_TIMING=1)
+timing_logger = logging.getLogger("app.timing")
+
+if SERVER_TIMING_ENABLED:
+    @app.middleware("http")
+    async def server_timing(request: Request, call_next):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            current_timings.reset(token)
+        handler_ms = (time.perf_counter() - start) * 1000
+        db_ms = timings.db_time * 1000
+        tpl_ms = timings.template_time * 1000
+        response.headers["Server-Timing"] = (
+            f'db;dur={db_ms:.1f};desc="{timings.query_count} queries", '
+            f"tpl;dur={tpl_ms:.1f}, "
+            f"app;dur={handler_ms:.1f}"
+        )
+        timing_logger.info(json.dumps({
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "queries": timings.query_count,
+            "db_ms": round(db_ms, 1),
+            "template_ms": round(tpl_ms, 1),
+            "handler_ms": round(handler_ms, 1),
+        }))
+        return response
+
+# N+1 / lazy-load detection for development and tests (QUERY_DEBUG=log|raise)
+if query_debug.QUERY_DEBUG_ENABLED:
+    @app.middleware("http")
+    async def query_debug_scope(request: Request, call_next):
+        token = query_debug.current_scope.set(query_debug.QueryScope())
+        try:
+            return await call_next(request)
+        finally:
+            query_debug.current_scope.reset(token)
+
 # Initialize Auth
 User, require_auth = init_auth(app, engine, Base, get_db, app_name="Invoice Manager")
 
@@ -48,12 +118,8 @@ app.include_router(clients.router)
 app.include_router(expenses.router)
 app.include_router(insights.router)
 app.include_router(billing.router)
-
-# Startup event
-@app.on_event("startup")
-def startup_event():
-    # Ensure all tables are created
-    # This includes User (from viv-auth), Billing tables (from viv-pay), and Invoice/Client/etc (from app.models)
-    # We must import app.models so models are registered in Base
-    import app.models
-    Base.metadata.create_all(bind=engine)
+app.include_router(api_v1.router)
+app.include_router(search_routes.router)
+app.include_router(recurring.router)
+app.include_router(reports.router)
+app.include_router(charts.router)
@@ -0,0 +1,110 @@
+import os
+from sqlalchemy import event
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST, multiprocess
+
+# Prometheus metrics for /metrics. When PROMETHEUS_MULTIPROC_DIR is set (a
+# directory shared by all workers, wiped before startup) every worker writes
+# its samples there and /metrics aggregates them, so the numbers are correct
+# no matter which worker serves the scrape.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route"],
+)
+REQUEST_COUNT = Counter(
+    "http_requests_total", "HTTP requests by route and status",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served",
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "DB connections currently checked out of the pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "DB connections open beyond the pool size",
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting to check a connection out of the pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds", "LLM call latency",
+    ["model", "insight_type"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+LLM_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "Time until the first streamed chunk of an LLM call",
+    ["model", "insight_type"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+LLM_ERRORS = Counter(
+    "llm_request_errors_total", "Failed LLM calls",
+    ["model", "insight_type"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "LLM tokens consumed",
+    ["model", "kind"],
+)
+
+WEBHOOK_DELIVERIES = Counter(
+    "webhook_deliveries_total", "Webhook delivery attempts by outcome",
+    ["result"], # "delivered", "retry", "failed"
+)
+WEBHOOK_LATENCY = Histogram(
+    "webhook_request_duration_seconds", "Webhook POST latency",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+
+STARTUP_SECONDS = Gauge(
+    "app_startup_seconds", "Worker startup time (schema check, pool and template warmup)",
+    multiprocess_mode="max",
+)
+WORKER_PEAK_RSS = Gauge(
+    "app_worker_peak_rss_bytes", "Peak resident memory of each worker",
+    multiprocess_mode="all",
+)
+
+def instrument_pool(engine):
+    # Pool events registered through the engine survive pool recreation
+    # (engine.dispose()), because QueuePool.recreate() carries the dispatch over.
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKED_OUT.inc()
+        update_overflow()
+
+    def on_checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+        update_overflow()
+
+    def update_overflow():
+        pool = engine.pool
+        if hasattr(pool, "overflow"):
+            DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+
+def record_llm_usage(model, usage):
+    # usage is the provider's usage metadata (may be missing on errors/stubs)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+    output_tokens = getattr(usage, "candidates_token_count", None) or 0
+    if prompt_tokens:
+        LLM_TOKENS.labels(model=model, kind="prompt").inc(prompt_tokens)
+    if output_tokens:
+        LLM_TOKENS.labels(model=model, kind="output").inc(output_tokens)
+
+def render_metrics():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
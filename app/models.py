@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Date, Float, Boolean, Enum as SQLAlchemyEnum
-from sqlalchemy.orm import relationship
+import zlib
+from itertools import chain
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Date, Float, Boolean, Index, LargeBinary, event, inspect, Enum as SQLAlchemyEnum
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
-from app.database import Base
+from app.database import Base, SessionLocal
 
 class Client(Base):
     __tablename__ = "clients"
@@ -23,9 +25,17 @@ class Client(Base):
 
 class Invoice(Base):
     __tablename__ = "invoices"
+    # Tenant-scoped lists and dashboards are range scans on these
+    __table_args__ = (
+        Index("ix_invoices_user_issue", "user_id", "issue_date"),
+        Index("ix_invoices_user_status", "user_id", "status"),
+        # Never reuse ids on SQLite: archived rows keep theirs (see AUTOINCREMENT_TABLES)
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False, index=True)
+    user_id = Column(String, nullable=True) # owner, copied from the client (see _set_invoice_owner)
     invoice_number = Column(String(50), unique=True, nullable=False)
     status = Column(String, default="draft") # "draft", "sent", "viewed", "paid", "overdue", "cancelled"
     issue_date = Column(Date, nullable=False)
@@ -45,9 +55,10 @@ class Invoice(Base):
 
 class LineItem(Base):
     __tablename__ = "line_items"
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False)
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, index=True)
     description = Column(String(300), nullable=False)
     quantity = Column(Float, default=1.0, nullable=False)
     unit_price = Column(Float, nullable=False)
@@ -58,6 +69,7 @@ class LineItem(Base):
 
 class Expense(Base):
     __tablename__ = "expenses"
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, nullable=False) # who logged this expense
@@ -70,13 +82,242 @@ class Expense(Base):
     receipt_ref = Column(String(100), nullable=True)
     tax_deductible = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+INSIGHT_PREVIEW_CHARS = 200
+INSIGHT_COMPRESS_MIN_BYTES = 1024
 
 class FinancialInsight(Base):
     __tablename__ = "financial_insights"
+    __table_args__ = (
+        Index("ix_financial_insights_requester", "requested_by", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     insight_type = Column(String, nullable=True) # "revenue_forecast", "expense_analysis", "cash_flow", "client_summary"
-    content = Column(Text, nullable=True)
+    # The report text lives in one of these; both are deferred so lists only
+    # load metadata and the preview. Read and write it through `body`.
+    content = deferred(Column(Text, nullable=True), group="content") # short reports and rows from before compression
+    content_compressed = deferred(Column(LargeBinary, nullable=True), group="content") # zlib
+    preview = Column(String(INSIGHT_PREVIEW_CHARS), nullable=True)
     model_used = Column(String, nullable=True)
     generated_at = Column(DateTime(timezone=True), server_default=func.now())
     requested_by = Column(String, nullable=True)
+
+    @property
+    def body(self):
+        if self.content_compressed is not None:
+            return zlib.decompress(self.content_compressed).decode()
+        return self.content
+
+    @body.setter
+    def body(self, text):
+        text = text or ""
+        encoded = text.encode()
+        if len(encoded) >= INSIGHT_COMPRESS_MIN_BYTES:
+            self.content, self.content_compressed = None, zlib.compress(encoded)
+        else:
+            self.content, self.content_compressed = text, None
+        self.preview = text[:INSIGHT_PREVIEW_CHARS]
+
+class MonthlyRollup(Base):
+    __tablename__ = "monthly_rollups"
+    # (user_id, dimension, month) prefix: any chart range is one index range scan
+    __table_args__ = (
+        Index("ux_monthly_rollups_key", "user_id", "dimension", "month", "metric", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, nullable=False)
+    metric = Column(String(20), nullable=False) # "revenue" (paid, by paid_date), "invoiced" (by issue_date), "expenses"
+    dimension = Column(String(150), nullable=False, default="") # "" for totals, "client:<id>", "category:<name>"
+    month = Column(Date, nullable=False) # first day of the month
+    amount = Column(Float, default=0.0)
+
+class InsightBatchRun(Base):
+    __tablename__ = "insight_batch_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), default="running") # "running", "completed"
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+class InsightBatchItem(Base):
+    __tablename__ = "insight_batch_items"
+    __table_args__ = (
+        Index("ux_insight_batch_items_work", "run_id", "user_id", "insight_type", unique=True),
+        Index("ix_insight_batch_items_tenant", "user_id", "insight_type", "status"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("insight_batch_runs.id"), nullable=False)
+    user_id = Column(String, nullable=False)
+    insight_type = Column(String, nullable=False)
+    data_fingerprint = Column(String(64), nullable=False) # hash of the tenant's source data when queued
+    status = Column(String(20), default="pending") # "pending", "done", "skipped", "failed"
+    insight_id = Column(Integer, ForeignKey("financial_insights.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    locked_until = Column(DateTime, nullable=True) # lease held by the worker generating it
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# Cold storage for old paid/cancelled invoices and old expenses, moved out of
+# the hot tables by app.archive. Rows keep their original ids and columns.
+class ArchivedInvoice(Base):
+    __tablename__ = "invoices_archive"
+    __table_args__ = (
+        Index("ix_invoices_archive_client_issue", "client_id", "issue_date"),
+        Index("ix_invoices_archive_user_issue", "user_id", "issue_date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    user_id = Column(String, nullable=True)
+    invoice_number = Column(String(50), nullable=False)
+    status = Column(String)
+    issue_date = Column(Date, nullable=False, index=True)
+    due_date = Column(Date, nullable=False)
+    subtotal = Column(Float, default=0.0)
+    tax_rate = Column(Float, default=0.0)
+    tax_amount = Column(Float, default=0.0)
+    total = Column(Float, default=0.0)
+    currency = Column(String(3), default="USD")
+    notes = Column(Text, nullable=True)
+    paid_date = Column(Date, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+
+    client = relationship("Client")
+    line_items = relationship("ArchivedLineItem", back_populates="invoice")
+
+class ArchivedLineItem(Base):
+    __tablename__ = "line_items_archive"
+
+    id = Column(Integer, primary_key=True)
+    invoice_id = Column(Integer, ForeignKey("invoices_archive.id"), nullable=False, index=True)
+    description = Column(String(300), nullable=False)
+    quantity = Column(Float, default=1.0, nullable=False)
+    unit_price = Column(Float, nullable=False)
+    amount = Column(Float, default=0.0)
+    created_at = Column(DateTime(timezone=True))
+
+    invoice = relationship("ArchivedInvoice", back_populates="line_items")
+
+class ArchivedExpense(Base):
+    __tablename__ = "expenses_archive"
+    __table_args__ = (
+        Index("ix_expenses_archive_user_date", "user_id", "date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, nullable=False)
+    category = Column(String, nullable=True)
+    description = Column(String(300), nullable=False)
+    amount = Column(Float, nullable=False)
+    currency = Column(String(3), default="USD")
+    date = Column(Date, nullable=False, index=True)
+    vendor = Column(String(200), nullable=True)
+    receipt_ref = Column(String(100), nullable=True)
+    tax_deductible = Column(Boolean, default=False)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+
+class RecurringInvoice(Base):
+    __tablename__ = "recurring_invoices"
+    # The scheduler scans active schedules by next_run_date
+    __table_args__ = (
+        Index("ix_recurring_invoices_due", "active", "next_run_date"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, nullable=False, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    cadence = Column(String(20), nullable=False, default="monthly") # "weekly", "monthly", "quarterly", "yearly"
+    start_date = Column(Date, nullable=False) # first period; later periods keep its day of month
+    end_date = Column(Date, nullable=True) # no periods after this date
+    next_run_date = Column(Date, nullable=False)
+    runs_count = Column(Integer, default=0) # periods generated so far; {n} in text is runs_count + 1
+    due_days = Column(Integer, default=14)
+    tax_rate = Column(Float, default=0.0)
+    currency = Column(String(3), default="USD")
+    notes = Column(Text, nullable=True)
+    active = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    client = relationship("Client")
+    line_items = relationship("RecurringLineItem", back_populates="schedule", cascade="all, delete-orphan")
+
+class RecurringLineItem(Base):
+    __tablename__ = "recurring_line_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    schedule_id = Column(Integer, ForeignKey("recurring_invoices.id"), nullable=False, index=True)
+    description = Column(String(300), nullable=False)
+    quantity = Column(Float, default=1.0, nullable=False)
+    unit_price = Column(Float, nullable=False)
+
+    schedule = relationship("RecurringInvoice", back_populates="line_items")
+
+class RecurringInvoiceRun(Base):
+    __tablename__ = "recurring_invoice_runs"
+    # One invoice per schedule and period, however often the scheduler runs
+    __table_args__ = (
+        Index("ux_recurring_invoice_runs_period", "schedule_id", "period", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    schedule_id = Column(Integer, ForeignKey("recurring_invoices.id"), nullable=False)
+    period = Column(Date, nullable=False)
+    invoice_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class InvoiceSequence(Base):
+    __tablename__ = "invoice_sequences"
+
+    prefix = Column(String(50), primary_key=True) # e.g. "INV-2026-"
+    last_value = Column(Integer, nullable=False, default=0)
+
+# Transactional outbox (see app.outbox): events are written in the same
+# transaction as the change they describe; app.webhooks fans each one out to
+# a delivery per configured endpoint and delivers them in the background.
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    uid = Column(String(36), nullable=True) # uuid4; ids alone repeat across shards
+    event_type = Column(String(50), nullable=False) # "invoice.created", "invoice.sent", "invoice.paid", "invoice.deleted", ...
+    aggregate_id = Column(Integer, nullable=False) # invoice id
+    user_id = Column(String, nullable=False)
+    payload = Column(Text, nullable=False) # JSON
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    fanned_out_at = Column(DateTime, nullable=True, index=True) # UTC; deliveries created
+
+class WebhookDelivery(Base):
+    __tablename__ = "webhook_deliveries"
+    __table_args__ = (
+        Index("ux_webhook_deliveries_event_endpoint", "event_id", "endpoint", unique=True),
+        Index("ix_webhook_deliveries_due", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, ForeignKey("outbox_events.id"), nullable=False)
+    endpoint = Column(String(500), nullable=False)
+    status = Column(String(20), nullable=False, default="pending") # "pending", "delivered", "failed"
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False) # UTC
+    locked_until = Column(DateTime, nullable=True) # UTC; claimed by a dispatcher until then
+    last_status_code = Column(Integer, nullable=True)
+    last_error = Column(Text, nullable=True)
+    delivered_at = Column(DateTime, nullable=True)
+
+@event.listens_for(SessionLocal, "before_flush")
+def _set_invoice_owner(session, flush_context, instances):
+    # Invoice.user_id mirrors the owning client's user_id so tenant queries
+    # don't need to go through clients. Bulk writes must set it themselves.
+    for obj in chain(session.new, session.dirty):
+        if not isinstance(obj, Invoice):
+            continue
+        if obj.user_id is not None and not inspect(obj).attrs.client_id.history.has_changes():
+            continue
+        client = session.get(Client, obj.client_id) if obj.client_id is not None else obj.client
+        if client is not None:
+            obj.user_id = client.user_id
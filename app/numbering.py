@@ -0,0 +1,61 @@
+from sqlalchemy import select, update
+from app.database import insert_ignoring_conflicts
+from app.models import Invoice, InvoiceSequence
+
+# Invoice numbers (INV-<year>-<seq>) handed out by one atomic
+# UPDATE ... RETURNING per batch, so concurrent generators never read the same
+# "last number" and collide on the unique invoice_number.
+
+def invoice_prefix(issue_date):
+    return f"INV-{issue_date.year}-"
+
+def format_invoice_number(prefix, value):
+    return f"{prefix}{value:03d}"
+
+def _parse_sequence(prefix, invoice_number):
+    try:
+        return int(invoice_number[len(prefix):])
+    except ValueError:
+        return 0
+
+def _highest_issued(conn, prefix):
+    numbers = conn.execute(select(Invoice.invoice_number).where(Invoice.invoice_number.like(f"{prefix}%"))).scalars()
+    return max((_parse_sequence(prefix, n) for n in numbers), default=0)
+
+def _ensure_sequence(conn, prefix):
+    # First use of a prefix: start after the highest number already issued
+    if conn.execute(select(InvoiceSequence.prefix).where(InvoiceSequence.prefix == prefix)).first():
+        return
+    start = _highest_issued(conn, prefix)
+    # A concurrent first use may have created it meanwhile; theirs wins
+    conn.execute(insert_ignoring_conflicts(conn, InvoiceSequence).values(prefix=prefix, last_value=start))
+
+def allocate_invoice_numbers(conn, prefix, count):
+    # Returns `count` unused invoice numbers for the prefix
+    _ensure_sequence(conn, prefix)
+    allocated = []
+    while len(allocated) < count:
+        wanted = count - len(allocated)
+        last = conn.execute(
+            update(InvoiceSequence)
+            .where(InvoiceSequence.prefix == prefix)
+            .values(last_value=InvoiceSequence.last_value + wanted)
+            .returning(InvoiceSequence.last_value)
+        ).scalar_one()
+        candidates = [format_invoice_number(prefix, v) for v in range(last - wanted + 1, last + 1)]
+        # Numbers typed by hand on the invoice form don't go through the
+        # sequence; skip any that are already taken
+        taken = set(conn.execute(select(Invoice.invoice_number).where(Invoice.invoice_number.in_(candidates))).scalars())
+        allocated.extend(n for n in candidates if n not in taken)
+    return allocated
+
+def suggest_invoice_number(conn, prefix):
+    # The number the sequence would hand out next, read without incrementing
+    # it (for prefilling the invoice form). Not reserved: a concurrent
+    # allocation can still take it, and the unique constraint catches that.
+    last = conn.execute(select(InvoiceSequence.last_value).where(InvoiceSequence.prefix == prefix)).scalar()
+    value = (_highest_issued(conn, prefix) if last is None else last) + 1
+    # Skip numbers typed by hand, as allocate_invoice_numbers does
+    while conn.execute(select(Invoice.id).where(Invoice.invoice_number == format_invoice_number(prefix, value))).first():
+        value += 1
+    return format_invoice_number(prefix, value)
@@ -0,0 +1,53 @@
+import json
+import uuid
+from datetime import date, datetime
+from sqlalchemy import insert
+from app.models import OutboxEvent
+
+# Transactional outbox for invoice events sent to external systems (the ERP).
+# Write paths record events through the same session or connection as the
+# change itself, so an event exists exactly when its change committed and no
+# request waits on the network. app.webhooks delivers them in the background.
+
+INVOICE_STATUS_EVENTS = {"sent": "invoice.sent", "paid": "invoice.paid"}
+
+PAYLOAD_FIELDS = [
+    "id", "invoice_number", "client_id", "status", "issue_date", "due_date", "paid_date",
+    "subtotal", "tax_rate", "tax_amount", "total", "currency",
+]
+
+def status_event_type(status):
+    return INVOICE_STATUS_EVENTS.get(status, "invoice.status_changed")
+
+def invoice_payload(invoice, **changes):
+    # invoice is an ORM object or a row with the PAYLOAD_FIELDS columns;
+    # changes override columns a bulk UPDATE is about to set
+    payload = {field: getattr(invoice, field, None) for field in PAYLOAD_FIELDS}
+    payload.update(changes)
+    return payload
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def event_row(event_type, user_id, payload):
+    return {
+        "uid": str(uuid.uuid4()),
+        "event_type": event_type,
+        "aggregate_id": payload["id"],
+        "user_id": user_id,
+        "payload": json.dumps(payload, default=_json_default),
+    }
+
+def record_invoice_event(db, event_type, invoice, **changes):
+    # Flushed with the session's next flush; call before commit. Needs
+    # invoice.id, so flush first for new invoices.
+    db.add(OutboxEvent(**event_row(event_type, invoice.user_id, invoice_payload(invoice, **changes))))
+
+def record_invoice_events(conn, events):
+    # Bulk variant for set-based write paths; events are
+    # (event_type, user_id, payload) tuples
+    rows = [event_row(event_type, user_id, payload) for event_type, user_id, payload in events]
+    if rows:
+        conn.execute(insert(OutboxEvent), rows)
@@ -0,0 +1,151 @@
+from dataclasses import dataclass
+from datetime import date
+from sqlalchemy import case, desc, func, select, union_all
+from app.models import Client, Invoice, Expense, ArchivedInvoice
+
+# Read-only rows for the list pages and dashboard tables. Each query selects
+# only the columns its template renders (no notes/address Text, no line
+# items) and each row becomes a small slotted dataclass instead of an ORM
+# object, so there is no identity map entry, attribute history or lazy
+# loader per row. Anything that edits goes through the ORM as before.
+#
+# Every query's columns are listed in the order of the dataclass fields and
+# the rows are built positionally. See benchmarks/list_projections.py.
+
+@dataclass(slots=True, frozen=True)
+class InvoiceRow:
+    id: int
+    invoice_number: str
+    client_name: str
+    issue_date: date
+    due_date: date
+    status: str
+    total: float
+
+@dataclass(slots=True, frozen=True)
+class OverdueInvoiceRow:
+    id: int
+    invoice_number: str
+    client_name: str
+    days_overdue: int
+
+@dataclass(slots=True, frozen=True)
+class ClientRow:
+    id: int
+    name: str
+    email: str
+    total_invoiced: float
+    total_paid: float
+
+    @property
+    def outstanding_balance(self):
+        return self.total_invoiced - self.total_paid
+
+@dataclass(slots=True, frozen=True)
+class ExpenseRow:
+    id: int
+    date: date
+    category: str
+    description: str
+    vendor: str
+    amount: float
+    tax_deductible: bool
+
+def _rows(db, cls, stmt):
+    return [cls(*row) for row in db.execute(stmt)]
+
+def _invoice_columns():
+    return (
+        Invoice.id, Invoice.invoice_number, Client.name, Invoice.issue_date,
+        Invoice.due_date, Invoice.status, Invoice.total,
+    )
+
+def list_invoices(db, user_id):
+    stmt = (
+        select(*_invoice_columns())
+        .join(Client, Invoice.client_id == Client.id)
+        .where(Invoice.user_id == user_id)
+        .order_by(desc(Invoice.issue_date))
+    )
+    return _rows(db, InvoiceRow, stmt)
+
+def recent_invoices(db, user_id, limit=10):
+    stmt = (
+        select(*_invoice_columns())
+        .join(Client, Invoice.client_id == Client.id)
+        .where(Invoice.user_id == user_id)
+        .order_by(desc(Invoice.created_at))
+        .limit(limit)
+    )
+    return _rows(db, InvoiceRow, stmt)
+
+def overdue_invoices(db, user_id, today):
+    stmt = (
+        select(Invoice.id, Invoice.invoice_number, Client.name, Invoice.due_date)
+        .join(Client, Invoice.client_id == Client.id)
+        .where(
+            Invoice.user_id == user_id,
+            Invoice.status.not_in(["paid", "cancelled", "draft"]),
+            Invoice.due_date < today,
+        )
+    )
+    return [
+        OverdueInvoiceRow(id, invoice_number, client_name, (today - due_date).days)
+        for id, invoice_number, client_name, due_date in db.execute(stmt)
+    ]
+
+def _client_invoice_totals(user_id, client_id=None):
+    # All-time invoiced and paid totals per client, over hot and archived
+    # invoices (app.archive moves old paid ones out of `invoices`)
+    sources = []
+    for model in (Invoice, ArchivedInvoice):
+        source = select(model.client_id, model.total, model.status).where(model.user_id == user_id)
+        if client_id is not None:
+            source = source.where(model.client_id == client_id)
+        sources.append(source)
+    invoices = union_all(*sources).subquery()
+    paid = case((invoices.c.status == "paid", invoices.c.total), else_=0.0)
+    return (
+        select(
+            invoices.c.client_id,
+            func.sum(invoices.c.total).label("invoiced"),
+            func.sum(paid).label("paid"),
+        )
+        .group_by(invoices.c.client_id)
+        .subquery()
+    )
+
+def client_totals(db, user_id, client_id):
+    # (invoiced, paid) for one client
+    totals = _client_invoice_totals(user_id, client_id)
+    row = db.execute(select(totals.c.invoiced, totals.c.paid)).first()
+    return (row.invoiced or 0.0, row.paid or 0.0) if row else (0.0, 0.0)
+
+def list_clients(db, user_id):
+    # Invoiced and paid totals come from one grouped query instead of loading
+    # every client's invoices
+    totals = _client_invoice_totals(user_id)
+    stmt = (
+        select(
+            Client.id, Client.name, Client.email,
+            func.coalesce(totals.c.invoiced, 0.0),
+            func.coalesce(totals.c.paid, 0.0),
+        )
+        .outerjoin(totals, totals.c.client_id == Client.id)
+        .where(Client.user_id == user_id)
+        .order_by(Client.name)
+    )
+    return _rows(db, ClientRow, stmt)
+
+def list_expenses(db, user_id, category=None):
+    stmt = (
+        select(
+            Expense.id, Expense.date, Expense.category, Expense.description,
+            Expense.vendor, Expense.amount, Expense.tax_deductible,
+        )
+        .where(Expense.user_id == user_id)
+        .order_by(desc(Expense.date))
+    )
+    if category:
+        stmt = stmt.where(Expense.category == category)
+    return _rows(db, ExpenseRow, stmt)
@@ -0,0 +1,115 @@
+import argparse
+import logging
+import os
+from sqlalchemy import delete, func, select, update
+from app.database import tenant_engine, tenant_engines
+from app.models import Client, Invoice, LineItem, ArchivedInvoice, ArchivedLineItem, RecurringInvoice, RecurringLineItem, RecurringInvoiceRun
+from app import outbox, rollups, search
+
+# Set-based client deletion. Invoices and line items (hot and archived) are
+# removed with bulk DELETE ... WHERE statements in batches instead of being
+# loaded and deleted one object at a time by the ORM cascade.
+#
+# Clients with more than CLIENT_DELETE_BACKGROUND_THRESHOLD invoices are
+# hidden first, by moving them to a tombstone owner ("deleting:<user_id>") so
+# every user-scoped query stops seeing them, and purged in the background.
+# Purges interrupted by a failure or restart are finished by resume_purges(),
+# which runs with the nightly archive job and from `python -m app.purge`. Purging the same client twice at once is safe.
+
+PURGE_BATCH_SIZE = int(os.environ.get("CLIENT_PURGE_BATCH_SIZE", "1000"))
+CLIENT_DELETE_BACKGROUND_THRESHOLD = int(os.environ.get("CLIENT_DELETE_BACKGROUND_THRESHOLD", "200"))
+
+TOMBSTONE_PREFIX = "deleting:"
+
+logger = logging.getLogger("app.purge")
+
+def tombstone_owner(user_id):
+    return f"{TOMBSTONE_PREFIX}{user_id}"
+
+def invoice_count(db, client_id):
+    # Hot and archived; both are purged
+    return sum(
+        db.execute(select(func.count(model.id)).where(model.client_id == client_id)).scalar()
+        for model in (Invoice, ArchivedInvoice)
+    )
+
+def hide_client(db, client_id, user_id):
+    # Set-based UPDATEs; the client and its invoices disappear from lists,
+    # detail pages and search
+    owner = tombstone_owner(user_id)
+    invoice_ids = db.execute(select(Invoice.id).where(Invoice.client_id == client_id)).scalars().all()
+    db.execute(update(Client).where(Client.id == client_id).values(user_id=owner))
+    for invoice_model in (Invoice, ArchivedInvoice):
+        db.execute(update(invoice_model).where(invoice_model.client_id == client_id).values(user_id=owner))
+    db.execute(update(RecurringInvoice).where(RecurringInvoice.client_id == client_id).values(active=False))
+    search.delete_documents(db.connection(), search.DOC_CLIENT, [client_id])
+    for start in range(0, len(invoice_ids), PURGE_BATCH_SIZE):
+        search.delete_documents(db.connection(), search.DOC_INVOICE, invoice_ids[start:start + PURGE_BATCH_SIZE])
+
+def _delete_invoice_batch(conn, invoice_model, line_item_model, client_id, user_id, batch_size):
+    # Returns the rollup months touched by the deleted batch
+    ids = conn.execute(
+        select(invoice_model.id).where(invoice_model.client_id == client_id).limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return None
+    conn.execute(delete(line_item_model).where(line_item_model.invoice_id.in_(ids)))
+    # Events only for rows this transaction deleted, in case another purge of
+    # the same client got to some of them first
+    rows = conn.execute(
+        delete(invoice_model)
+        .where(invoice_model.id.in_(ids))
+        .returning(*[getattr(invoice_model, field) for field in outbox.PAYLOAD_FIELDS])
+    ).all()
+    ids = [row.id for row in rows]
+    search.delete_documents(conn, search.DOC_INVOICE, ids)
+    outbox.record_invoice_events(conn, [("invoice.deleted", user_id, outbox.invoice_payload(row)) for row in rows])
+    return {rollups.month_start(d) for row in rows for d in (row.issue_date, row.paid_date) if d}
+
+def purge_client(client_id, user_id, batch_size=PURGE_BATCH_SIZE, bind=None):
+    # Delete a client and everything under it, one committed batch at a time
+    bind = bind or tenant_engine(user_id)
+    months = set()
+    for invoice_model, line_item_model in ((Invoice, LineItem), (ArchivedInvoice, ArchivedLineItem)):
+        while True:
+            with bind.begin() as conn:
+                touched = _delete_invoice_batch(conn, invoice_model, line_item_model, client_id, user_id, batch_size)
+            if touched is None:
+                break
+            months |= touched
+    with bind.begin() as conn:
+        schedules = select(RecurringInvoice.id).where(RecurringInvoice.client_id == client_id)
+        conn.execute(delete(RecurringInvoiceRun).where(RecurringInvoiceRun.schedule_id.in_(schedules)))
+        conn.execute(delete(RecurringLineItem).where(RecurringLineItem.schedule_id.in_(schedules)))
+        conn.execute(delete(RecurringInvoice).where(RecurringInvoice.client_id == client_id))
+        conn.execute(delete(Client).where(Client.id == client_id))
+        search.delete_documents(conn, search.DOC_CLIENT, [client_id])
+        rollups.refresh_months(conn, {(user_id, month) for month in months})
+
+def purge_client_in_background(client_id, user_id):
+    # Entry point for the delete route; a failure leaves the client hidden
+    # for resume_purges to finish
+    try:
+        purge_client(client_id, user_id)
+    except Exception:
+        logger.exception("Purge of client %s failed", client_id)
+
+def resume_purges(batch_size=PURGE_BATCH_SIZE):
+    # Returns the number of hidden clients purged
+    count = 0
+    for bind in tenant_engines():
+        with bind.connect() as conn:
+            hidden = conn.execute(
+                select(Client.id, Client.user_id).where(Client.user_id.like(f"{TOMBSTONE_PREFIX}%"))
+            ).all()
+        for client_id, owner in hidden:
+            purge_client(client_id, owner[len(TOMBSTONE_PREFIX):], batch_size, bind)
+        count += len(hidden)
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Finish deleting clients hidden for background purge")
+    parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+    args = parser.parse_args()
+    count = resume_purges(args.batch_size)
+    print(f"Purged {count} clients")
@@ -0,0 +1,92 @@
+import logging
+import os
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+
+# Development/test aid for catching N+1 patterns: counts lazy relationship
+# loads and identical statement shapes (same SQL, any parameters) per request.
+#   QUERY_DEBUG=log    log a warning with the offending stack once per shape
+#   QUERY_DEBUG=raise  raise QueryBudgetExceeded at the offending query
+# QUERY_DEBUG_THRESHOLD is how many repeats a request may issue before it is flagged.
+QUERY_DEBUG = os.environ.get("QUERY_DEBUG", "").lower()
+QUERY_DEBUG_ENABLED = QUERY_DEBUG in ("log", "raise")
+QUERY_DEBUG_THRESHOLD = int(os.environ.get("QUERY_DEBUG_THRESHOLD", "5"))
+
+logger = logging.getLogger("app.query_debug")
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+class QueryScope:
+    __slots__ = ("statements", "lazy_loads", "reported")
+
+    def __init__(self):
+        self.statements = Counter()
+        self.lazy_loads = Counter()
+        self.reported = set()
+
+# Set by the middleware in app.main for the duration of a request
+current_scope: ContextVar = ContextVar("current_query_scope", default=None)
+
+def _check(scope, kind, key, count):
+    if count <= QUERY_DEBUG_THRESHOLD or (kind, key) in scope.reported:
+        return
+    scope.reported.add((kind, key))
+    message = f"{kind} repeated {count} times in one request (threshold {QUERY_DEBUG_THRESHOLD}): {key}"
+    if QUERY_DEBUG == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning("%s\n%s", message, "".join(traceback.format_stack(limit=30)[:-2]))
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    scope = current_scope.get()
+    if scope is None:
+        return
+    scope.statements[statement] += 1
+    _check(scope, "Statement", statement, scope.statements[statement])
+
+def install_engine(engine):
+    event.listen(engine, "before_cursor_execute", _count_statement)
+
+def install_session(session_factory):
+    @event.listens_for(session_factory, "do_orm_execute")
+    def _count_lazy_load(orm_execute_state):
+        # lazy_loaded_from is only set for lazy="select" loads triggered by
+        # attribute access, not for eager/selectin loads
+        if orm_execute_state.lazy_loaded_from is None:
+            return
+        scope = current_scope.get()
+        if scope is None:
+            return
+        key = str(orm_execute_state.loader_strategy_path[-1])
+        scope.lazy_loads[key] += 1
+        _check(scope, "Lazy load", key, scope.lazy_loads[key])
+
+@contextmanager
+def assert_max_queries(max_queries, engine=None):
+    # Test helper: fails if the block issues more than max_queries statements.
+    # Counts on the engine itself, so it also sees queries run by TestClient's
+    # worker thread.
+    if engine is None:
+        from app.database import engine
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+    if len(statements) > max_queries:
+        listing = "\n".join(f"  {i + 1}. {s}" for i, s in enumerate(statements))
+        raise AssertionError(f"Expected at most {max_queries} queries, got {len(statements)}:\n{listing}")
+
+def assert_route_max_queries(client, url, max_queries, method="GET", **kwargs):
+    # e.g. assert_route_max_queries(TestClient(app), "/invoices", 10)
+    with assert_max_queries(max_queries):
+        response = client.request(method, url, **kwargs)
+    return response
@@ -0,0 +1,191 @@
+import argparse
+import calendar
+import os
+from datetime import date, timedelta
+from sqlalchemy import bindparam, insert, select, update
+from app.database import engine, insert_ignoring_conflicts, tenant_engines
+from app.models import Invoice, LineItem, RecurringInvoice, RecurringLineItem, RecurringInvoiceRun
+from app.numbering import allocate_invoice_numbers, invoice_prefix
+from app import outbox, rollups, search
+
+# Recurring invoice schedules (retainers). One scheduler pass generates every
+# due invoice across all tenants, a batch of schedules per transaction:
+#   python -m app.recurring [--date 2026-03-01]
+#
+# Each (schedule, period) is claimed in recurring_invoice_runs with
+# INSERT ... ON CONFLICT DO NOTHING before anything is generated, so re-running
+# a pass for the same period creates nothing twice. Numbers come from
+# app.numbering in one allocation per batch; invoices and line items are
+# written with bulk INSERTs, so search and rollups are refreshed explicitly
+# and the invoice.created outbox events are inserted in the same transaction.
+#
+# "{n}" in notes and line item descriptions is replaced with the period's
+# sequence number ("Mobile app development - Sprint {n}").
+
+CADENCES = ["weekly", "monthly", "quarterly", "yearly"]
+CADENCE_MONTHS = {"monthly": 1, "quarterly": 3, "yearly": 12}
+
+RECURRING_BATCH_SIZE = int(os.environ.get("RECURRING_BATCH_SIZE", "500"))
+MAX_CATCH_UP_PERIODS = 12 # per schedule and pass; the rest is picked up next pass
+
+def period_date(start_date, cadence, n):
+    # Date of the n-th period (0-based); monthly periods keep the start day,
+    # clamped to the length of shorter months
+    if cadence == "weekly":
+        return start_date + timedelta(weeks=n)
+    index = start_date.year * 12 + start_date.month - 1 + CADENCE_MONTHS[cadence] * n
+    year, month = index // 12, index % 12 + 1
+    return date(year, month, min(start_date.day, calendar.monthrange(year, month)[1]))
+
+def render_text(text, n):
+    return text.replace("{n}", str(n)) if text else text
+
+def next_period_from(schedule, today):
+    # (runs_count, next_run_date) of the first period on or after today;
+    # used when a paused schedule is resumed so missed periods are skipped
+    n = schedule.runs_count or 0
+    next_run = period_date(schedule.start_date, schedule.cadence, n)
+    while next_run < today:
+        n += 1
+        next_run = period_date(schedule.start_date, schedule.cadence, n)
+    return n, next_run
+
+def _due_periods(schedule, as_of):
+    # Returns ([(n, period)], schedule updates)
+    periods = []
+    n = schedule.runs_count or 0
+    period = schedule.next_run_date
+    while period <= as_of and (schedule.end_date is None or period <= schedule.end_date) and len(periods) < MAX_CATCH_UP_PERIODS:
+        periods.append((n, period))
+        n += 1
+        period = period_date(schedule.start_date, schedule.cadence, n)
+    return periods, {
+        "b_id": schedule.id,
+        "runs_count": n,
+        "next_run_date": period,
+        "active": schedule.end_date is None or period <= schedule.end_date,
+    }
+
+def _generate_batch(conn, schedules, as_of):
+    due = []
+    schedule_updates = []
+    for schedule in schedules:
+        periods, updates = _due_periods(schedule, as_of)
+        due.extend((schedule, n, period) for n, period in periods)
+        schedule_updates.append(updates)
+
+    created = []
+    if due:
+        # Claim the periods; ones already claimed by an earlier pass are skipped
+        claimed = {
+            (row.schedule_id, row.period): row.id
+            for row in conn.execute(
+                insert_ignoring_conflicts(conn, RecurringInvoiceRun).returning(
+                    RecurringInvoiceRun.id, RecurringInvoiceRun.schedule_id, RecurringInvoiceRun.period
+                ),
+                [{"schedule_id": schedule.id, "period": period} for schedule, _, period in due]
+            )
+        }
+        created = [(schedule, n, period, claimed[(schedule.id, period)]) for schedule, n, period in due if (schedule.id, period) in claimed]
+
+    if created:
+        items = {}
+        for item in conn.execute(
+            select(RecurringLineItem)
+            .where(RecurringLineItem.schedule_id.in_({schedule.id for schedule, _, _, _ in created}))
+            .order_by(RecurringLineItem.id)
+        ):
+            items.setdefault(item.schedule_id, []).append(item)
+
+        numbers = {}
+        for prefix in {invoice_prefix(period) for _, _, period, _ in created}:
+            count = sum(1 for _, _, period, _ in created if invoice_prefix(period) == prefix)
+            numbers[prefix] = iter(allocate_invoice_numbers(conn, prefix, count))
+
+        invoice_rows = []
+        for schedule, n, period, _ in created:
+            subtotal = sum(item.quantity * item.unit_price for item in items.get(schedule.id, []))
+            tax_amount = subtotal * ((schedule.tax_rate or 0.0) / 100)
+            invoice_rows.append({
+                "client_id": schedule.client_id,
+                "user_id": schedule.user_id,
+                "invoice_number": next(numbers[invoice_prefix(period)]),
+                "status": "draft",
+                "issue_date": period,
+                "due_date": period + timedelta(days=schedule.due_days or 0),
+                "subtotal": subtotal,
+                "tax_rate": schedule.tax_rate or 0.0,
+                "tax_amount": tax_amount,
+                "total": subtotal + tax_amount,
+                "currency": schedule.currency or "USD",
+                "notes": render_text(schedule.notes, n + 1),
+            })
+        invoice_ids = conn.execute(
+            insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True), invoice_rows
+        ).scalars().all()
+
+        line_item_rows = [
+            {
+                "invoice_id": invoice_id,
+                "description": render_text(item.description, n + 1),
+                "quantity": item.quantity,
+                "unit_price": item.unit_price,
+                "amount": item.quantity * item.unit_price,
+            }
+            for (schedule, n, _, _), invoice_id in zip(created, invoice_ids)
+            for item in items.get(schedule.id, [])
+        ]
+        if line_item_rows:
+            conn.execute(insert(LineItem), line_item_rows)
+        conn.execute(
+            update(RecurringInvoiceRun).where(RecurringInvoiceRun.id == bindparam("b_run_id")).values(invoice_id=bindparam("b_invoice_id")),
+            [{"b_run_id": run_id, "b_invoice_id": invoice_id} for (_, _, _, run_id), invoice_id in zip(created, invoice_ids)]
+        )
+        outbox.record_invoice_events(conn, [
+            ("invoice.created", row["user_id"], {**{field: row.get(field) for field in outbox.PAYLOAD_FIELDS}, "id": invoice_id})
+            for row, invoice_id in zip(invoice_rows, invoice_ids)
+        ])
+        search.refresh_documents(conn, search.DOC_INVOICE, invoice_ids)
+        rollups.refresh_months(conn, {(schedule.user_id, rollups.month_start(period)) for schedule, _, period, _ in created})
+
+    conn.execute(
+        update(RecurringInvoice).where(RecurringInvoice.id == bindparam("b_id")).values(
+            runs_count=bindparam("runs_count"),
+            next_run_date=bindparam("next_run_date"),
+            active=bindparam("active"),
+        ),
+        schedule_updates
+    )
+    return len(created)
+
+def generate_due_invoices(as_of=None, batch_size=RECURRING_BATCH_SIZE, bind=None):
+    # Returns {"schedules": n, "invoices": n} processed in this pass, over
+    # every shard unless bind is given
+    as_of = as_of or date.today()
+    summary = {"schedules": 0, "invoices": 0}
+    for tenant_bind in [bind] if bind else tenant_engines():
+        last_id = 0
+        while True:
+            with tenant_bind.begin() as conn:
+                schedules = conn.execute(
+                    select(RecurringInvoice)
+                    .where(RecurringInvoice.active.is_(True), RecurringInvoice.next_run_date <= as_of, RecurringInvoice.id > last_id)
+                    .order_by(RecurringInvoice.id)
+                    .limit(batch_size)
+                ).all()
+                if not schedules:
+                    break
+                summary["invoices"] += _generate_batch(conn, schedules, as_of)
+            summary["schedules"] += len(schedules)
+            last_id = schedules[-1].id
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate all due recurring invoices")
+    parser.add_argument("--date", type=date.fromisoformat, help="generate periods due on or before this day (default: today)")
+    parser.add_argument("--batch-size", type=int, default=RECURRING_BATCH_SIZE)
+    args = parser.parse_args()
+    from app.schema import check_schema
+    check_schema(engine)
+    summary = generate_due_invoices(args.date, args.batch_size)
+    print(f"Generated {summary['invoices']} invoices from {summary['schedules']} schedules")
@@ -0,0 +1,48 @@
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.orm import undefer_group
+from app.models import Client, Invoice, Expense, FinancialInsight, RecurringInvoice
+
+# Tenant-scoped lookups shared by the routers. Each statement is a
+# lambda_stmt: SQLAlchemy builds and compiles it once per call site and on
+# later calls only extracts the closure values (ids, user_id) as bound
+# parameters, instead of rebuilding the Query and re-deriving its cache key
+# on every request. See benchmarks/ownership_lookups.py.
+#
+# Every function takes the owner's user_id as a string and returns None when
+# the row doesn't exist or belongs to someone else.
+
+def get_client(db, user_id, client_id):
+    stmt = lambda_stmt(lambda: select(Client))
+    stmt += lambda s: s.where(Client.id == client_id, Client.user_id == user_id).limit(1)
+    return db.execute(stmt).scalars().first()
+
+def client_exists(db, user_id, client_id):
+    stmt = lambda_stmt(lambda: select(Client.id))
+    stmt += lambda s: s.where(Client.id == client_id, Client.user_id == user_id).limit(1)
+    return db.execute(stmt).first() is not None
+
+def list_clients(db, user_id):
+    stmt = lambda_stmt(lambda: select(Client))
+    stmt += lambda s: s.where(Client.user_id == user_id).order_by(Client.name)
+    return db.execute(stmt).scalars().all()
+
+def get_invoice(db, user_id, invoice_id):
+    stmt = lambda_stmt(lambda: select(Invoice))
+    stmt += lambda s: s.where(Invoice.id == invoice_id, Invoice.user_id == user_id).limit(1)
+    return db.execute(stmt).scalars().first()
+
+def get_expense(db, user_id, expense_id):
+    stmt = lambda_stmt(lambda: select(Expense))
+    stmt += lambda s: s.where(Expense.id == expense_id, Expense.user_id == user_id).limit(1)
+    return db.execute(stmt).scalars().first()
+
+def get_insight(db, user_id, insight_id):
+    # With the deferred report body, for the detail page
+    stmt = lambda_stmt(lambda: select(FinancialInsight).options(undefer_group("content")))
+    stmt += lambda s: s.where(FinancialInsight.id == insight_id, FinancialInsight.requested_by == user_id).limit(1)
+    return db.execute(stmt).scalars().first()
+
+def get_recurring_invoice(db, user_id, schedule_id):
+    stmt = lambda_stmt(lambda: select(RecurringInvoice))
+    stmt += lambda s: s.where(RecurringInvoice.id == schedule_id, RecurringInvoice.user_id == user_id).limit(1)
+    return db.execute(stmt).scalars().first()
@@ -0,0 +1,226 @@
+import argparse
+from datetime import date
+from itertools import chain
+from sqlalchemy import delete, event, func, insert, inspect, select, text, tuple_
+from app.database import SessionLocal, engine, tenant_engine, tenant_engines
+from app.models import Invoice, Expense, MonthlyRollup, ArchivedInvoice, ArchivedExpense
+
+# Per-user monthly rollups of revenue (paid invoices by paid_date), invoiced
+# amounts (by issue_date) and expenses (by date), each as a total plus a
+# per-client or per-category breakdown. Charts read any range from here with
+# one indexed range scan instead of running SUMs over the source tables.
+#
+# An after_flush hook on SessionLocal recomputes the (user, month) buckets
+# touched by ORM writes in the same transaction. Writes that bypass the unit
+# of work (bulk UPDATE/DELETE) must call refresh_months() themselves.
+# `python -m app.rollups backfill` rebuilds everything from the source tables.
+# Source tables are always read together with their archive tables
+# (app.archive), so moving rows to cold storage doesn't change any bucket.
+
+INVOICE_SOURCES = (Invoice, ArchivedInvoice)
+EXPENSE_SOURCES = (Expense, ArchivedExpense)
+
+REVENUE = "revenue"
+INVOICED = "invoiced"
+EXPENSES = "expenses"
+TOTAL = ""
+
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+def client_dimension(client_id):
+    return f"client:{client_id}"
+
+def category_dimension(category):
+    return f"category:{category or 'other'}"
+
+def _aggregate_month(conn, user_id, month):
+    # Returns {(metric, dimension): amount} for one user and month
+    start, end = month, add_months(month, 1)
+    totals = {}
+
+    def add(metric, dimension, amount):
+        totals[(metric, TOTAL)] = totals.get((metric, TOTAL), 0.0) + (amount or 0.0)
+        totals[(metric, dimension)] = totals.get((metric, dimension), 0.0) + (amount or 0.0)
+
+    for source in INVOICE_SOURCES:
+        for client_id, amount in conn.execute(
+            select(source.client_id, func.sum(source.total))
+            .where(source.user_id == user_id, source.status == "paid", source.paid_date >= start, source.paid_date < end)
+            .group_by(source.client_id)
+        ):
+            add(REVENUE, client_dimension(client_id), amount)
+        for client_id, amount in conn.execute(
+            select(source.client_id, func.sum(source.total))
+            .where(source.user_id == user_id, source.issue_date >= start, source.issue_date < end)
+            .group_by(source.client_id)
+        ):
+            add(INVOICED, client_dimension(client_id), amount)
+    for source in EXPENSE_SOURCES:
+        for category, amount in conn.execute(
+            select(source.category, func.sum(source.amount))
+            .where(source.user_id == user_id, source.date >= start, source.date < end)
+            .group_by(source.category)
+        ):
+            add(EXPENSES, category_dimension(category), amount)
+    return totals
+
+def _upsert(conn):
+    # INSERT ... ON CONFLICT (the rollup key) DO UPDATE SET amount, for the
+    # bound dialect (SQLite or Postgres)
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(MonthlyRollup)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "dimension", "month", "metric"],
+        set_={"amount": stmt.excluded.amount},
+    )
+
+def _lock_month(conn, user_id, month):
+    # Concurrent writers to one user-month take turns on Postgres, so each
+    # aggregates after the previous one committed instead of overwriting it
+    # with a total that misses its rows. SQLite already serializes writers.
+    if conn.dialect.name == "postgresql":
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:user_id), :month)"),
+            {"user_id": user_id, "month": month.year * 12 + month.month},
+        )
+
+def refresh_months(conn, user_months):
+    # Recompute the rollup rows for each (user_id, month) from the source
+    # tables. Upserted rather than deleted and re-inserted, so two
+    # transactions refreshing the same month never collide on the unique key.
+    for user_id, month in sorted(user_months):
+        _lock_month(conn, user_id, month)
+        totals = _aggregate_month(conn, user_id, month)
+        conn.execute(delete(MonthlyRollup).where(
+            MonthlyRollup.user_id == user_id,
+            MonthlyRollup.month == month,
+            tuple_(MonthlyRollup.metric, MonthlyRollup.dimension).not_in(list(totals)),
+        ))
+        rows = [
+            {"user_id": user_id, "metric": metric, "dimension": dimension, "month": month, "amount": amount}
+            for (metric, dimension), amount in sorted(totals.items())
+        ]
+        if rows:
+            conn.execute(_upsert(conn), rows)
+
+def _history_values(obj, attr):
+    # Old and new values of an attribute as of this flush
+    history = inspect(obj).attrs[attr].history
+    return {v for v in chain(history.added or (), history.unchanged or (), history.deleted or ()) if v is not None}
+
+@event.listens_for(SessionLocal, "after_flush")
+def _sync_rollups(session, flush_context):
+    user_months = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Invoice):
+            months = {month_start(d) for d in _history_values(obj, "issue_date") | _history_values(obj, "paid_date")}
+        elif isinstance(obj, Expense):
+            months = {month_start(d) for d in _history_values(obj, "date")}
+        else:
+            continue
+        user_months.update((u, m) for u in _history_values(obj, "user_id") for m in months)
+    if user_months:
+        refresh_months(session.connection(), user_months)
+
+def _month_key(conn, column):
+    if conn.dialect.name == "sqlite":
+        return func.strftime("%Y-%m", column)
+    return func.to_char(column, "YYYY-MM")
+
+def backfill(conn, user_id=None):
+    # Rebuild rollups from the source tables with one grouped query per metric
+    stmt = delete(MonthlyRollup)
+    if user_id is not None:
+        stmt = stmt.where(MonthlyRollup.user_id == user_id)
+    conn.execute(stmt)
+
+    totals = {}
+    def add(user, metric, dimension, month_key, amount):
+        month = date(int(month_key[:4]), int(month_key[5:7]), 1)
+        for key in ((user, metric, TOTAL, month), (user, metric, dimension, month)):
+            totals[key] = totals.get(key, 0.0) + (amount or 0.0)
+
+    for source in INVOICE_SOURCES:
+        paid_month = _month_key(conn, source.paid_date)
+        issue_month = _month_key(conn, source.issue_date)
+        revenue = (
+            select(source.user_id, source.client_id, paid_month, func.sum(source.total))
+            .where(source.status == "paid", source.paid_date.is_not(None))
+            .group_by(source.user_id, source.client_id, paid_month)
+        )
+        invoiced = (
+            select(source.user_id, source.client_id, issue_month, func.sum(source.total))
+            .group_by(source.user_id, source.client_id, issue_month)
+        )
+        if user_id is not None:
+            revenue = revenue.where(source.user_id == user_id)
+            invoiced = invoiced.where(source.user_id == user_id)
+        for user, client_id, month_key, amount in conn.execute(revenue):
+            add(user, REVENUE, client_dimension(client_id), month_key, amount)
+        for user, client_id, month_key, amount in conn.execute(invoiced):
+            add(user, INVOICED, client_dimension(client_id), month_key, amount)
+    for source in EXPENSE_SOURCES:
+        expense_month = _month_key(conn, source.date)
+        expenses = (
+            select(source.user_id, source.category, expense_month, func.sum(source.amount))
+            .group_by(source.user_id, source.category, expense_month)
+        )
+        if user_id is not None:
+            expenses = expenses.where(source.user_id == user_id)
+        for user, category, month_key, amount in conn.execute(expenses):
+            add(user, EXPENSES, category_dimension(category), month_key, amount)
+
+    rows = [
+        {"user_id": user, "metric": metric, "dimension": dimension, "month": month, "amount": amount}
+        for (user, metric, dimension, month), amount in totals.items()
+    ]
+    for i in range(0, len(rows), 1000):
+        conn.execute(insert(MonthlyRollup), rows[i:i + 1000])
+    return len(rows)
+
+def ensure_rollups(engine):
+    # First start after the table was introduced: build it from existing data
+    with engine.begin() as conn:
+        if conn.execute(select(MonthlyRollup.id).limit(1)).first() is None:
+            if conn.execute(select(Invoice.id).limit(1)).first() or conn.execute(select(Expense.id).limit(1)).first():
+                backfill(conn)
+
+def monthly_series(db, user_id, end_month, months, metrics, dimension=TOTAL):
+    # Returns (list of month dates, {metric: [amount per month]}) ending at end_month
+    start_month = add_months(end_month, -(months - 1))
+    month_list = [add_months(start_month, i) for i in range(months)]
+    series = {metric: [0.0] * months for metric in metrics}
+    rows = db.execute(
+        select(MonthlyRollup.month, MonthlyRollup.metric, MonthlyRollup.amount).where(
+            MonthlyRollup.user_id == user_id,
+            MonthlyRollup.dimension == dimension,
+            MonthlyRollup.month >= start_month,
+            MonthlyRollup.month <= end_month,
+            MonthlyRollup.metric.in_(metrics),
+        )
+    )
+    positions = {m: i for i, m in enumerate(month_list)}
+    for month, metric, amount in rows:
+        series[metric][positions[month]] = amount or 0.0
+    return month_list, series
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the monthly rollup table")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--user", help="only rebuild this user's rollups")
+    args = parser.parse_args()
+    from app.schema import check_schema
+    check_schema(engine)
+    count = 0
+    for bind in [tenant_engine(args.user)] if args.user else tenant_engines():
+        with bind.begin() as conn:
+            count += backfill(conn, args.user)
+    print(f"Wrote {count} rollup rows")
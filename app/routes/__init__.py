@@ -1,3 +1,7 @@
+from typing import Any
+from fastapi import Depends
+from app.database import tenant_session
+
 # Placeholders for dependency injection from main.py
 # This avoids circular imports and allows flexible configuration
 
@@ -14,3 +18,13 @@ def get_current_user():
 
 def get_active_subscription():
     pass
+
+# Session for the authenticated user's data: their shard when SQLite sharding
+# is on (see app.database), otherwise the main database. Depends on
+# get_current_user, so it resolves the same (cached) user as the route.
+def get_tenant_db(user: Any = Depends(get_current_user)):
+    db = tenant_session(user.id)
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,371 @@
+import base64
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import Session, load_only, selectinload, undefer_group
+from sqlalchemy import desc
+from app.models import Client, Invoice, Expense, FinancialInsight, ArchivedInvoice, ArchivedExpense
+from app.archive import reaches_archive
+from app.routes import get_current_user, get_active_subscription, get_tenant_db
+from app.search import search
+from typing import Any, List, Optional
+from datetime import date, datetime
+from pydantic import BaseModel, ConfigDict, Field
+
+# JSON API for integrations. Handlers return ORJSONResponse directly (no
+# template rendering, no second response_model validation pass); the
+# response_model declarations document the contract. Lists support sparse
+# fieldsets (?fields=id,total) and keyset cursors on id, so deep pages cost
+# the same as the first one. Invoice and expense lists also read the archive
+# tables when a date range reaches back into archived data.
+router = APIRouter(prefix="/api/v1", default_response_class=ORJSONResponse)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+class ClientOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    email: str
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    city: Optional[str] = None
+    country: Optional[str] = None
+    tax_id: Optional[str] = None
+    notes: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class LineItemOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    description: str
+    quantity: float
+    unit_price: float
+    amount: Optional[float] = None
+
+class InvoiceOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    client_id: int
+    invoice_number: str
+    status: Optional[str] = None
+    issue_date: date
+    due_date: date
+    subtotal: Optional[float] = None
+    tax_rate: Optional[float] = None
+    tax_amount: Optional[float] = None
+    total: Optional[float] = None
+    currency: Optional[str] = None
+    notes: Optional[str] = None
+    paid_date: Optional[date] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class InvoiceWithLineItemsOut(InvoiceOut):
+    line_items: List[LineItemOut] = []
+
+class ExpenseOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    category: Optional[str] = None
+    description: str
+    amount: float
+    currency: Optional[str] = None
+    date: date
+    vendor: Optional[str] = None
+    receipt_ref: Optional[str] = None
+    tax_deductible: Optional[bool] = None
+    created_at: Optional[datetime] = None
+
+class InsightOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    insight_type: Optional[str] = None
+    content: Optional[str] = Field(None, validation_alias="body") # stored compressed, see FinancialInsight.body
+    model_used: Optional[str] = None
+    generated_at: Optional[datetime] = None
+
+class ClientPage(BaseModel):
+    data: List[ClientOut]
+    next_cursor: Optional[str] = None
+
+class InvoicePage(BaseModel):
+    data: List[InvoiceWithLineItemsOut]
+    next_cursor: Optional[str] = None
+
+class ExpensePage(BaseModel):
+    data: List[ExpenseOut]
+    next_cursor: Optional[str] = None
+
+class InsightPage(BaseModel):
+    data: List[InsightOut]
+    next_cursor: Optional[str] = None
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields, schema, model):
+    # Returns (fields to dump, ORM load_only option) for ?fields=a,b,c
+    if not fields:
+        return None, None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - set(schema.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    attributes = {source_attribute(schema, f) for f in requested}
+    columns = [getattr(model, a) for a in attributes if a in model.__table__.columns]
+    return requested, load_only(*columns)
+
+def source_attribute(schema, field):
+    # Fields read from a differently named attribute (InsightOut.content <- body)
+    alias = schema.model_fields[field].validation_alias
+    return alias if isinstance(alias, str) else field
+
+def wants_field(fields, field):
+    return not fields or field in {f.strip() for f in fields.split(",")}
+
+def parse_include(include, allowed):
+    if not include:
+        return set()
+    requested = {i.strip() for i in include.split(",") if i.strip()}
+    unknown = requested - allowed
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(sorted(unknown))}")
+    return requested
+
+def dump(schema, obj, fields=None):
+    if fields is None:
+        return schema.model_validate(obj).model_dump()
+    # Sparse fieldset: only touch the requested attributes, so columns left
+    # out by load_only() are never lazy-loaded one row at a time
+    data = {name: getattr(obj, source_attribute(schema, name)) for name in fields}
+    if "line_items" in schema.model_fields:
+        data["line_items"] = [LineItemOut.model_validate(li).model_dump() for li in obj.line_items]
+    return data
+
+def page(sources, schema, limit, cursor, fields, options=()):
+    # sources: [(query, model)]. Hot and archive tables share ids, so each
+    # source is keyset-paged on its own and the pages are merged by id.
+    # options are applied after the sparse fieldset's load_only().
+    rows = []
+    for query, model in sources:
+        dump_fields, load_option = parse_fields(fields, schema, model)
+        if load_option is not None:
+            query = query.options(load_option)
+        if options:
+            query = query.options(*options)
+        if cursor:
+            query = query.filter(model.id < decode_cursor(cursor))
+        rows.extend(query.order_by(desc(model.id)).limit(limit + 1).all())
+    if len(sources) > 1:
+        rows.sort(key=lambda row: row.id, reverse=True)
+    next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+    return ORJSONResponse({
+        "data": [dump(schema, row, dump_fields) for row in rows[:limit]],
+        "next_cursor": next_cursor,
+    })
+
+@router.get("/clients", response_model=ClientPage)
+def api_list_clients(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    query = db.query(Client).filter(Client.user_id == str(user.id))
+    return page([(query, Client)], ClientOut, limit, cursor, fields)
+
+@router.get("/clients/{id}", response_model=ClientOut)
+def api_get_client(
+    id: int,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    dump_fields, load_option = parse_fields(fields, ClientOut, Client)
+    query = db.query(Client).filter(Client.id == id, Client.user_id == str(user.id))
+    if load_option is not None:
+        query = query.options(load_option)
+    client = query.first()
+    if not client:
+        raise HTTPException(status_code=404, detail="Client not found")
+    return ORJSONResponse(dump(ClientOut, client, dump_fields))
+
+@router.get("/invoices", response_model=InvoicePage)
+def api_list_invoices(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    status: Optional[str] = None,
+    client_id: Optional[int] = None,
+    issued_from: Optional[date] = None,
+    issued_to: Optional[date] = None,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    includes = parse_include(include, {"line_items"})
+    models = [Invoice]
+    if reaches_archive(db, ArchivedInvoice.issue_date, issued_from, issued_to):
+        models.append(ArchivedInvoice)
+    sources = []
+    for model in models:
+        query = db.query(model).filter(model.user_id == str(user.id))
+        if status:
+            query = query.filter(model.status == status)
+        if client_id:
+            query = query.filter(model.client_id == client_id)
+        if issued_from:
+            query = query.filter(model.issue_date >= issued_from)
+        if issued_to:
+            query = query.filter(model.issue_date <= issued_to)
+        if "line_items" in includes:
+            # One batched IN query for the whole page instead of one per invoice
+            query = query.options(selectinload(model.line_items))
+        sources.append((query, model))
+    schema = InvoiceWithLineItemsOut if "line_items" in includes else InvoiceOut
+    return page(sources, schema, limit, cursor, fields)
+
+@router.get("/invoices/{id}", response_model=InvoiceOut)
+def api_get_invoice(
+    id: int,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    includes = parse_include(include, {"line_items"})
+    schema = InvoiceWithLineItemsOut if "line_items" in includes else InvoiceOut
+    invoice = None
+    # Archived invoices keep their ids; fall back to the archive on a miss
+    for model in (Invoice, ArchivedInvoice):
+        dump_fields, load_option = parse_fields(fields, schema, model)
+        query = db.query(model).filter(model.id == id, model.user_id == str(user.id))
+        if load_option is not None:
+            query = query.options(load_option)
+        if "line_items" in includes:
+            query = query.options(selectinload(model.line_items))
+        invoice = query.first()
+        if invoice:
+            break
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return ORJSONResponse(dump(schema, invoice, dump_fields))
+
+@router.get("/expenses", response_model=ExpensePage)
+def api_list_expenses(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    category: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    models = [Expense]
+    if reaches_archive(db, ArchivedExpense.date, date_from, date_to):
+        models.append(ArchivedExpense)
+    sources = []
+    for model in models:
+        query = db.query(model).filter(model.user_id == str(user.id))
+        if category:
+            query = query.filter(model.category == category)
+        if date_from:
+            query = query.filter(model.date >= date_from)
+        if date_to:
+            query = query.filter(model.date <= date_to)
+        sources.append((query, model))
+    return page(sources, ExpenseOut, limit, cursor, fields)
+
+@router.get("/expenses/{id}", response_model=ExpenseOut)
+def api_get_expense(
+    id: int,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    expense = None
+    for model in (Expense, ArchivedExpense):
+        dump_fields, load_option = parse_fields(fields, ExpenseOut, model)
+        query = db.query(model).filter(model.id == id, model.user_id == str(user.id))
+        if load_option is not None:
+            query = query.options(load_option)
+        expense = query.first()
+        if expense:
+            break
+    if not expense:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    return ORJSONResponse(dump(ExpenseOut, expense, dump_fields))
+
+@router.get("/insights", response_model=InsightPage)
+def api_list_insights(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    insight_type: Optional[str] = None,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    query = db.query(FinancialInsight).filter(FinancialInsight.requested_by == str(user.id))
+    if insight_type:
+        query = query.filter(FinancialInsight.insight_type == insight_type)
+    # Load the deferred body with the page instead of once per row
+    options = [undefer_group("content")] if wants_field(fields, "content") else []
+    return page([(query, FinancialInsight)], InsightOut, limit, cursor, fields, options)
+
+@router.get("/insights/{id}", response_model=InsightOut)
+def api_get_insight(
+    id: int,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    dump_fields, load_option = parse_fields(fields, InsightOut, FinancialInsight)
+    query = db.query(FinancialInsight).filter(FinancialInsight.id == id, FinancialInsight.requested_by == str(user.id))
+    if load_option is not None:
+        query = query.options(load_option)
+    if wants_field(fields, "content"):
+        query = query.options(undefer_group("content"))
+    insight = query.first()
+    if not insight:
+        raise HTTPException(status_code=404, detail="Insight not found")
+    return ORJSONResponse(dump(InsightOut, insight, dump_fields))
+
+@router.get("/search")
+def api_search(
+    q: str,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    # snippet_html is escaped index text with <mark> around matched terms
+    results = search(db, str(user.id), q, limit=limit)
+    return ORJSONResponse({"data": [
+        {"type": r["type"], "id": r["id"], "title": r["title"], "snippet_html": str(r["snippet"]), "url": r["url"]}
+        for r in results
+    ]})
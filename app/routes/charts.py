@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.routes import get_current_user, get_active_subscription, get_tenant_db
+from app import repository, rollups
+from typing import Any, Optional
+from datetime import date
+import datetime
+
+router = APIRouter()
+
+MAX_CHART_MONTHS = 60
+
+@router.get("/api/charts/monthly")
+async def monthly_chart(
+    months: int = Query(12, ge=1, le=MAX_CHART_MONTHS),
+    end: Optional[str] = None, # "YYYY-MM", defaults to the current month
+    client_id: Optional[int] = None,
+    category: Optional[str] = None,
+    compare: Optional[str] = None, # "yoy" adds the same months one year earlier
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    if client_id and category:
+        raise HTTPException(status_code=400, detail="Use either client_id or category, not both")
+    if compare not in (None, "yoy"):
+        raise HTTPException(status_code=400, detail="compare must be 'yoy'")
+    try:
+        end_month = rollups.month_start(datetime.datetime.strptime(end, "%Y-%m").date()) if end else rollups.month_start(date.today())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="end must be YYYY-MM")
+
+    if client_id:
+        if not repository.client_exists(db, str(user.id), client_id):
+            raise HTTPException(status_code=404, detail="Client not found")
+        dimension = rollups.client_dimension(client_id)
+        metrics = [rollups.REVENUE, rollups.INVOICED]
+    elif category:
+        dimension = rollups.category_dimension(category)
+        metrics = [rollups.EXPENSES]
+    else:
+        dimension = rollups.TOTAL
+        metrics = [rollups.REVENUE, rollups.INVOICED, rollups.EXPENSES]
+
+    # Year-over-year reads both years in the same range scan
+    span = months + 12 if compare == "yoy" else months
+    month_list, series = rollups.monthly_series(db, str(user.id), end_month, span, metrics, dimension)
+
+    result = {
+        "months": [m.strftime("%Y-%m") for m in month_list[-months:]],
+        "series": {metric: values[-months:] for metric, values in series.items()},
+    }
+    if compare == "yoy":
+        result["previous"] = {
+            "months": [m.strftime("%Y-%m") for m in month_list[:months]],
+            "series": {metric: values[:months] for metric, values in series.items()},
+        }
+    return result
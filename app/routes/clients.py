@@ -1,32 +1,25 @@
-from fastapi import APIRouter, Depends, Request, Form, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Request, Form, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
-from app.database import get_db
 from app.models import Client, Invoice
-from app.routes import get_current_user, get_active_subscription
+from app import projections, repository
+from app.purge import CLIENT_DELETE_BACKGROUND_THRESHOLD, hide_client, invoice_count, purge_client_in_background
+from app.routes import get_current_user, get_active_subscription, get_tenant_db
+from app.templating import templates
 from typing import Any, Optional
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/clients", response_class=HTMLResponse)
 async def list_clients(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    clients = db.query(Client).filter(Client.user_id == str(user.id)).order_by(Client.name).all()
-    
-    # Calculate stats for each client
-    for client in clients:
-        invoices = db.query(Invoice).filter(Invoice.client_id == client.id).all()
-        client.total_invoiced = sum(inv.total for inv in invoices)
-        client.total_paid = sum(inv.total for inv in invoices if inv.status == 'paid')
-        client.outstanding_balance = client.total_invoiced - client.total_paid
-        
+    clients = projections.list_clients(db, str(user.id))
     return templates.TemplateResponse("clients/list.html", {"request": request, "user": user, "clients": clients})
 
 @router.get("/clients/new", response_class=HTMLResponse)
@@ -48,7 +41,7 @@ async def create_client(
     country: Optional[str] = Form(None),
     tax_id: Optional[str] = Form(None),
     notes: Optional[str] = Form(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
@@ -72,17 +65,18 @@ async def create_client(
 async def client_detail(
     request: Request,
     id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    client = db.query(Client).filter(Client.id == id, Client.user_id == str(user.id)).first()
+    client = repository.get_client(db, str(user.id), id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
         
     invoices = db.query(Invoice).filter(Invoice.client_id == client.id).order_by(desc(Invoice.issue_date)).all()
     
-    total_revenue = sum(inv.total for inv in invoices if inv.status == 'paid')
+    # All-time, including invoices moved to the archive
+    _, total_revenue = projections.client_totals(db, str(user.id), client.id)
     
     return templates.TemplateResponse("clients/detail.html", {
         "request": request, 
@@ -96,11 +90,11 @@ async def client_detail(
 async def edit_client_form(
     request: Request,
     id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    client = db.query(Client).filter(Client.id == id, Client.user_id == str(user.id)).first()
+    client = repository.get_client(db, str(user.id), id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
         
@@ -118,11 +112,11 @@ async def update_client(
     country: Optional[str] = Form(None),
     tax_id: Optional[str] = Form(None),
     notes: Optional[str] = Form(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    client = db.query(Client).filter(Client.id == id, Client.user_id == str(user.id)).first()
+    client = repository.get_client(db, str(user.id), id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
         
@@ -142,17 +136,26 @@ async def update_client(
 async def delete_client(
     request: Request,
     id: int,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    client = db.query(Client).filter(Client.id == id, Client.user_id == str(user.id)).first()
+    client = repository.get_client(db, str(user.id), id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
     
-    # Invoices will be deleted due to cascade if configured, but let's trust models.py
-    # models.py: invoices = relationship(..., cascade="all, delete-orphan")
-    
-    db.delete(client)
+    # Bulk deletes instead of the ORM cascade, which loads every invoice and
+    # line item first. The client is hidden first, so a purge that fails
+    # partway is finished by resume_purges rather than left half-deleted.
+    # Large clients are purged after the response, small ones before it; both
+    # off the event loop.
+    client_id, user_id = client.id, client.user_id
+    large = invoice_count(db, client_id) > CLIENT_DELETE_BACKGROUND_THRESHOLD
+    hide_client(db, client_id, user_id)
     db.commit()
+    if large:
+        background_tasks.add_task(purge_client_in_background, client_id, user_id)
+    else:
+        await run_in_threadpool(purge_client_in_background, client_id, user_id)
     return RedirectResponse(url="/clients", status_code=status.HTTP_303_SEE_OTHER)
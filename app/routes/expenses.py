@@ -1,31 +1,25 @@
 from fastapi import APIRouter, Depends, Request, Form, HTTPException, status
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
-from app.database import get_db
 from app.models import Expense
-from app.routes import get_current_user, get_active_subscription
+from app import projections, repository
+from app.routes import get_current_user, get_active_subscription, get_tenant_db
+from app.templating import templates
 from typing import Any, Optional
 import datetime
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/expenses", response_class=HTMLResponse)
 async def list_expenses(
     request: Request,
     category: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    query = db.query(Expense).filter(Expense.user_id == str(user.id))
-    if category:
-        query = query.filter(Expense.category == category)
-        
-    expenses = query.order_by(desc(Expense.date)).all()
-    
+    expenses = projections.list_expenses(db, str(user.id), category)
     total_amount = sum(e.amount for e in expenses)
     
     return templates.TemplateResponse("expenses/list.html", {
@@ -57,7 +51,7 @@ async def create_expense(
     category: str = Form("other"),
     vendor: Optional[str] = Form(None),
     tax_deductible: bool = Form(False),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
@@ -78,11 +72,11 @@ async def create_expense(
 async def edit_expense_form(
     request: Request,
     id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    expense = db.query(Expense).filter(Expense.id == id, Expense.user_id == str(user.id)).first()
+    expense = repository.get_expense(db, str(user.id), id)
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
         
@@ -98,11 +92,11 @@ async def update_expense(
     category: str = Form("other"),
     vendor: Optional[str] = Form(None),
     tax_deductible: bool = Form(False),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    expense = db.query(Expense).filter(Expense.id == id, Expense.user_id == str(user.id)).first()
+    expense = repository.get_expense(db, str(user.id), id)
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
         
@@ -120,11 +114,11 @@ async def update_expense(
 async def delete_expense(
     request: Request,
     id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    expense = db.query(Expense).filter(Expense.id == id, Expense.user_id == str(user.id)).first()
+    expense = repository.get_expense(db, str(user.id), id)
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
         
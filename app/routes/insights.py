@@ -1,27 +1,32 @@
-import os
 from fastapi import APIRouter, Depends, Request, HTTPException, status
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-from app.database import get_db
+from app.database import tenant_session
+from app import metrics
+from app.llm import get_provider, generate_insight, ProviderNotConfigured
+from app.insight_context import InsightType, build_prompt
 from app.models import Invoice, Expense, Client, FinancialInsight
-from app.routes import get_current_user, get_active_subscription
-from typing import Any
-from google import genai
+from app import repository
+from app.routes import get_current_user, get_active_subscription, get_tenant_db
+from app.templating import templates
+from typing import Any, Optional
 from pydantic import BaseModel
 import json
+import time
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
+
+INSIGHTS_PAGE_SIZE = 20
 
 class InsightRequest(BaseModel):
-    insight_type: str
+    insight_type: InsightType # anything else is rejected with 422
 
 @router.get("/insights", response_class=HTMLResponse)
 async def list_insights(
     request: Request,
-    db: Session = Depends(get_db),
+    before: Optional[int] = None, # keyset cursor: show insights older than this id
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
@@ -35,21 +40,32 @@ async def list_insights(
     # Let's filter by requested_by being the user's ID or email.
     # Viv-auth User usually has 'id' and 'email'.
     
-    insights = db.query(FinancialInsight).filter(FinancialInsight.requested_by == str(user.id)).order_by(desc(FinancialInsight.generated_at)).all()
+    # Metadata and preview only (the report body is deferred), newest first,
+    # one page at a time along the (requested_by, id) index
+    query = db.query(FinancialInsight).filter(FinancialInsight.requested_by == str(user.id))
+    if before:
+        query = query.filter(FinancialInsight.id < before)
+    insights = query.order_by(desc(FinancialInsight.id)).limit(INSIGHTS_PAGE_SIZE + 1).all()
+    older = insights[INSIGHTS_PAGE_SIZE - 1].id if len(insights) > INSIGHTS_PAGE_SIZE else None
     
-    return templates.TemplateResponse("insights/dashboard.html", {"request": request, "user": user, "insights": insights})
+    return templates.TemplateResponse("insights/dashboard.html", {
+        "request": request,
+        "user": user,
+        "insights": insights[:INSIGHTS_PAGE_SIZE],
+        "older": older,
+        "paged": bool(before)
+    })
 
 @router.get("/insights/{id}", response_class=HTMLResponse)
 async def insight_detail(
     request: Request,
     id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    insight = db.query(FinancialInsight).filter(FinancialInsight.id == id).first()
-    # Check ownership
-    if not insight or insight.requested_by != str(user.id):
+    insight = repository.get_insight(db, str(user.id), id)
+    if not insight:
         raise HTTPException(status_code=404, detail="Insight not found")
         
     return templates.TemplateResponse("insights/detail.html", {"request": request, "user": user, "insight": insight})
@@ -58,83 +74,27 @@ async def insight_detail(
 async def analyze_insights(
     request: Request,
     body: InsightRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
-        return JSONResponse(status_code=500, content={"error": "Google API Key not configured"})
-
-    context_data = ""
-    
-    # Helper to serialize objects
-    def serialize_model(obj):
-        d = {}
-        for c in obj.__table__.columns:
-            val = getattr(obj, c.name)
-            if hasattr(val, 'isoformat'):
-                val = val.isoformat()
-            d[c.name] = val
-        return d
+    try:
+        provider = get_provider()
+        provider.ensure_ready()
+    except ProviderNotConfigured as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
 
-    if body.insight_type == "revenue_forecast":
-        # Get recent invoices
-        # User's clients
-        client_ids = db.query(Client.id).filter(Client.user_id == str(user.id)).all()
-        client_ids = [c[0] for c in client_ids]
-        
-        invoices = db.query(Invoice).filter(Invoice.client_id.in_(client_ids)).order_by(desc(Invoice.issue_date)).limit(50).all()
-        inv_data = [serialize_model(i) for i in invoices]
-        context_data = f"Invoices: {json.dumps(inv_data)}"
-        
-    elif body.insight_type == "expense_analysis":
-        expenses = db.query(Expense).filter(Expense.user_id == str(user.id)).order_by(desc(Expense.date)).limit(50).all()
-        exp_data = [serialize_model(e) for e in expenses]
-        context_data = f"Expenses: {json.dumps(exp_data)}"
-        
-    elif body.insight_type == "cash_flow":
-        client_ids = db.query(Client.id).filter(Client.user_id == str(user.id)).all()
-        client_ids = [c[0] for c in client_ids]
-        invoices = db.query(Invoice).filter(Invoice.client_id.in_(client_ids)).order_by(desc(Invoice.issue_date)).limit(20).all()
-        expenses = db.query(Expense).filter(Expense.user_id == str(user.id)).order_by(desc(Expense.date)).limit(20).all()
-        
-        inv_data = [serialize_model(i) for i in invoices]
-        exp_data = [serialize_model(e) for e in expenses]
-        context_data = f"Invoices: {json.dumps(inv_data)}\nExpenses: {json.dumps(exp_data)}"
-        
-    elif body.insight_type == "client_summary":
-        clients = db.query(Client).filter(Client.user_id == str(user.id)).all()
-        client_data = []
-        for c in clients:
-            c_dict = serialize_model(c)
-            # Add basic stats
-            invs = db.query(Invoice).filter(Invoice.client_id == c.id).all()
-            c_dict['total_invoiced'] = sum(i.total for i in invs)
-            c_dict['total_paid'] = sum(i.total for i in invs if i.status == 'paid')
-            client_data.append(c_dict)
-        context_data = f"Clients: {json.dumps(client_data)}"
-    
-    prompt = f"""
-    You are a financial analyst AI for an invoice management application. 
-    Analyze the provided data and generate a '{body.insight_type}'. 
-    Provide actionable insights, trends, and recommendations. 
-    Keep the tone professional but accessible.
-    
-    Data:
-    {context_data}
-    """
+    prompt = build_prompt(db, str(user.id), body.insight_type)
     
     try:
-        client = genai.Client(api_key=api_key)
-        response = client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
-        content = response.text
+        generation = generate_insight(provider, prompt, body.insight_type)
+        content = generation.text
         
         # Save insight
         insight = FinancialInsight(
             insight_type=body.insight_type,
-            content=content,
-            model_used="gemini-2.5-flash",
+            body=content,
+            model_used=generation.model,
             requested_by=str(user.id)
         )
         db.add(insight)
@@ -144,3 +104,67 @@ async def analyze_insights(
         return {"id": insight.id, "content": content}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_insight(provider, prompt, insight_type, user_id):
+    # Runs in the threadpool (sync generator); forwards chunks as they arrive
+    # and persists the assembled insight once the model is done
+    labels = {"model": provider.model, "insight_type": insight_type}
+    start = time.perf_counter()
+    chunks = []
+    usage = None
+    try:
+        for generation in provider.stream(prompt):
+            if not chunks:
+                metrics.LLM_FIRST_TOKEN.labels(**labels).observe(time.perf_counter() - start)
+            chunks.append(generation.text)
+            usage = generation.usage or usage
+            if generation.text:
+                yield sse("chunk", {"text": generation.text})
+    except Exception as e:
+        metrics.LLM_ERRORS.labels(**labels).inc()
+        yield sse("error", {"error": str(e)})
+        return
+    finally:
+        metrics.LLM_LATENCY.labels(**labels).observe(time.perf_counter() - start)
+    metrics.record_llm_usage(provider.model, usage)
+
+    # The request's session is already closed by the time the body streams
+    db = tenant_session(user_id)
+    try:
+        insight = FinancialInsight(
+            insight_type=insight_type,
+            body="".join(chunks),
+            model_used=provider.model,
+            requested_by=user_id
+        )
+        db.add(insight)
+        db.commit()
+        yield sse("done", {"id": insight.id})
+    except Exception as e:
+        yield sse("error", {"error": str(e)})
+    finally:
+        db.close()
+
+@router.post("/api/insights/analyze/stream")
+async def analyze_insights_stream(
+    request: Request,
+    body: InsightRequest,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    try:
+        provider = get_provider()
+        provider.ensure_ready()
+    except ProviderNotConfigured as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    prompt = build_prompt(db, str(user.id), body.insight_type)
+    return StreamingResponse(
+        stream_insight(provider, prompt, body.insight_type, str(user.id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
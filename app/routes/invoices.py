@@ -1,53 +1,57 @@
 from fastapi import APIRouter, Depends, Request, Form, HTTPException, status
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
-from app.database import get_db
+from sqlalchemy import func
 from app.models import Invoice, LineItem, Client
-from app.routes import get_current_user, get_active_subscription
+from app import repository
+from app.routes import get_current_user, get_active_subscription, get_tenant_db
+from app.templating import templates
+from app import outbox, projections, rollups
+from app.numbering import invoice_prefix, suggest_invoice_number
 from typing import Any, List, Optional
 from datetime import date
+from pydantic import BaseModel
 import datetime
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
+
+INVOICE_STATUSES = ["draft", "sent", "viewed", "paid", "overdue", "cancelled"]
+MAX_BULK_INVOICES = 1000
+
+class BulkStatusRequest(BaseModel):
+    invoice_ids: List[int]
+    status: str
+    paid_date: Optional[date] = None
+
+def status_change_values(status_val, paid_date=None):
+    # Marking paid stamps paid_date (today unless given); any other status clears it
+    return {
+        "status": status_val,
+        "paid_date": (paid_date or date.today()) if status_val == "paid" else None,
+    }
 
 @router.get("/invoices", response_class=HTMLResponse)
 async def list_invoices(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    clients = db.query(Client.id).filter(Client.user_id == str(user.id)).subquery()
-    invoices = db.query(Invoice).filter(Invoice.client_id.in_(clients)).order_by(desc(Invoice.issue_date)).all()
+    invoices = projections.list_invoices(db, str(user.id))
     return templates.TemplateResponse("invoices/list.html", {"request": request, "user": user, "invoices": invoices, "today": date.today()})
 
 @router.get("/invoices/new", response_class=HTMLResponse)
 async def new_invoice_form(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    clients = db.query(Client).filter(Client.user_id == str(user.id)).all()
+    clients = repository.list_clients(db, str(user.id))
     
-    # Auto-generate invoice number
+    # Suggest the sequence's next number; the user can still edit it
     today = date.today()
-    year_prefix = f"INV-{today.year}-"
-    last_invoice = db.query(Invoice).filter(Invoice.invoice_number.like(f"{year_prefix}%")).order_by(desc(Invoice.id)).first()
-    
-    if last_invoice:
-        try:
-            last_seq = int(last_invoice.invoice_number.split("-")[-1])
-            new_seq = last_seq + 1
-        except:
-            new_seq = 1
-    else:
-        new_seq = 1
-        
-    next_invoice_number = f"{year_prefix}{new_seq:03d}"
+    next_invoice_number = suggest_invoice_number(db, invoice_prefix(today))
     
     return templates.TemplateResponse("invoices/form.html", {
         "request": request, 
@@ -70,12 +74,12 @@ async def create_invoice(
     descriptions: List[str] = Form([]),
     quantities: List[float] = Form([]),
     unit_prices: List[float] = Form([]),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
     # Verify client belongs to user
-    client = db.query(Client).filter(Client.id == client_id, Client.user_id == str(user.id)).first()
+    client = repository.get_client(db, str(user.id), client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
         
@@ -89,6 +93,7 @@ async def create_invoice(
     
     new_invoice = Invoice(
         client_id=client_id,
+        user_id=str(user.id),
         invoice_number=invoice_number,
         issue_date=datetime.datetime.strptime(issue_date, "%Y-%m-%d").date(),
         due_date=datetime.datetime.strptime(due_date, "%Y-%m-%d").date(),
@@ -119,6 +124,7 @@ async def create_invoice(
     new_invoice.subtotal = subtotal
     new_invoice.tax_amount = subtotal * (tax_rate / 100)
     new_invoice.total = subtotal + new_invoice.tax_amount
+    outbox.record_invoice_event(db, "invoice.created", new_invoice)
     
     db.commit()
     return RedirectResponse(url=f"/invoices/{new_invoice.id}", status_code=status.HTTP_303_SEE_OTHER)
@@ -127,12 +133,11 @@ async def create_invoice(
 async def invoice_detail(
     request: Request,
     id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    # Join with Client to ensure ownership
-    invoice = db.query(Invoice).join(Client).filter(Invoice.id == id, Client.user_id == str(user.id)).first()
+    invoice = repository.get_invoice(db, str(user.id), id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
         
@@ -142,15 +147,15 @@ async def invoice_detail(
 async def edit_invoice_form(
     request: Request,
     id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    invoice = db.query(Invoice).join(Client).filter(Invoice.id == id, Client.user_id == str(user.id)).first()
+    invoice = repository.get_invoice(db, str(user.id), id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
         
-    clients = db.query(Client).filter(Client.user_id == str(user.id)).all()
+    clients = repository.list_clients(db, str(user.id))
     
     return templates.TemplateResponse("invoices/form.html", {
         "request": request, 
@@ -173,13 +178,15 @@ async def update_invoice(
     descriptions: List[str] = Form([]),
     quantities: List[float] = Form([]),
     unit_prices: List[float] = Form([]),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    invoice = db.query(Invoice).join(Client).filter(Invoice.id == id, Client.user_id == str(user.id)).first()
+    invoice = repository.get_invoice(db, str(user.id), id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
+    if client_id != invoice.client_id and not repository.client_exists(db, str(user.id), client_id):
+        raise HTTPException(status_code=404, detail="Client not found")
 
     # Update fields
     invoice.client_id = client_id
@@ -216,6 +223,7 @@ async def update_invoice(
     invoice.subtotal = subtotal
     invoice.tax_amount = subtotal * (tax_rate / 100)
     invoice.total = subtotal + invoice.tax_amount
+    outbox.record_invoice_event(db, "invoice.updated", invoice)
     
     db.commit()
     return RedirectResponse(url=f"/invoices/{id}", status_code=status.HTTP_303_SEE_OTHER)
@@ -225,37 +233,84 @@ async def update_invoice_status(
     request: Request,
     id: int,
     status_val: str = Form(...), # 'sent', 'paid', 'cancelled', etc.
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    invoice = db.query(Invoice).join(Client).filter(Invoice.id == id, Client.user_id == str(user.id)).first()
+    invoice = repository.get_invoice(db, str(user.id), id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
         
-    if status_val in ["draft", "sent", "viewed", "paid", "overdue", "cancelled"]:
-        invoice.status = status_val
-        if status_val == 'paid':
-            invoice.paid_date = date.today()
-        elif status_val != 'paid' and invoice.paid_date:
-            invoice.paid_date = None
-            
+    if status_val in INVOICE_STATUSES:
+        changed = status_val != invoice.status
+        values = status_change_values(status_val)
+        invoice.status = values["status"]
+        invoice.paid_date = values["paid_date"]
+        if changed:
+            outbox.record_invoice_event(db, outbox.status_event_type(status_val), invoice)
         db.commit()
         
     return RedirectResponse(url=f"/invoices/{id}", status_code=status.HTTP_303_SEE_OTHER)
 
+@router.post("/api/invoices/bulk-status")
+async def bulk_update_invoice_status(
+    body: BulkStatusRequest,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    if body.status not in INVOICE_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    if body.paid_date and body.status != "paid":
+        raise HTTPException(status_code=400, detail="paid_date is only allowed when marking invoices paid")
+
+    invoice_ids = list(dict.fromkeys(body.invoice_ids))
+    if len(invoice_ids) > MAX_BULK_INVOICES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_INVOICES} invoices per request")
+
+    # One ownership query for the whole batch, then one set-based UPDATE
+    rows = db.query(*[getattr(Invoice, field) for field in outbox.PAYLOAD_FIELDS]).filter(
+        Invoice.id.in_(invoice_ids),
+        Invoice.user_id == str(user.id)
+    ).all()
+    owned = {row.id for row in rows}
+    if owned:
+        values = status_change_values(body.status, body.paid_date)
+        db.query(Invoice).filter(Invoice.id.in_(owned)).update(values, synchronize_session=False)
+        # Bulk UPDATE bypasses the flush hooks; refresh the revenue months it moved
+        paid_months = {rollups.month_start(row.paid_date) for row in rows if row.paid_date}
+        if values["paid_date"]:
+            paid_months.add(rollups.month_start(values["paid_date"]))
+        rollups.refresh_months(db.connection(), {(str(user.id), m) for m in paid_months})
+        # Same transaction as the UPDATE; invoices already in the status get no event
+        outbox.record_invoice_events(db.connection(), [
+            (outbox.status_event_type(body.status), str(user.id), outbox.invoice_payload(row, **values))
+            for row in rows if row.status != body.status
+        ])
+        db.commit()
+
+    return {
+        "status": body.status,
+        "updated": len(owned),
+        "results": [
+            {"id": invoice_id, "result": "updated" if invoice_id in owned else "not_found"}
+            for invoice_id in invoice_ids
+        ],
+    }
+
 @router.post("/invoices/{id}/delete")
 async def delete_invoice(
     request: Request,
     id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_tenant_db),
     user: Any = Depends(get_current_user),
     sub: Any = Depends(get_active_subscription)
 ):
-    invoice = db.query(Invoice).join(Client).filter(Invoice.id == id, Client.user_id == str(user.id)).first()
+    invoice = repository.get_invoice(db, str(user.id), id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
         
+    outbox.record_invoice_event(db, "invoice.deleted", invoice)
     db.delete(invoice)
     db.commit()
     return RedirectResponse(url="/invoices", status_code=status.HTTP_303_SEE_OTHER)
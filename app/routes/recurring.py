@@ -0,0 +1,132 @@
+from fastapi import APIRouter, Depends, Request, Form, HTTPException, status
+from fastapi.responses import HTMLResponse, RedirectResponse
+from sqlalchemy.orm import Session, joinedload
+from app.models import RecurringInvoice, RecurringLineItem, RecurringInvoiceRun
+from app import repository
+from app.recurring import CADENCES, next_period_from
+from app.routes import get_current_user, get_active_subscription, get_tenant_db
+from app.templating import templates
+from typing import Any, List, Optional
+from datetime import date
+import datetime
+
+router = APIRouter()
+
+@router.get("/recurring", response_class=HTMLResponse)
+async def list_recurring(
+    request: Request,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    schedules = db.query(RecurringInvoice).options(
+        joinedload(RecurringInvoice.client),
+        joinedload(RecurringInvoice.line_items)
+    ).filter(RecurringInvoice.user_id == str(user.id)).order_by(RecurringInvoice.next_run_date).all()
+    return templates.TemplateResponse("recurring/list.html", {"request": request, "user": user, "schedules": schedules})
+
+@router.get("/recurring/new", response_class=HTMLResponse)
+async def new_recurring_form(
+    request: Request,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    clients = repository.list_clients(db, str(user.id))
+    return templates.TemplateResponse("recurring/form.html", {
+        "request": request,
+        "user": user,
+        "clients": clients,
+        "cadences": CADENCES,
+        "today": date.today()
+    })
+
+@router.post("/recurring/new")
+async def create_recurring(
+    request: Request,
+    client_id: int = Form(...),
+    cadence: str = Form(...),
+    start_date: str = Form(...),
+    end_date: Optional[str] = Form(None),
+    due_days: int = Form(14),
+    tax_rate: float = Form(0.0),
+    currency: str = Form("USD"),
+    notes: Optional[str] = Form(None),
+    descriptions: List[str] = Form([]),
+    quantities: List[float] = Form([]),
+    unit_prices: List[float] = Form([]),
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    client = repository.get_client(db, str(user.id), client_id)
+    if not client:
+        raise HTTPException(status_code=404, detail="Client not found")
+    if cadence not in CADENCES:
+        raise HTTPException(status_code=400, detail="Invalid cadence")
+
+    start = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+    schedule = RecurringInvoice(
+        user_id=str(user.id),
+        client_id=client_id,
+        cadence=cadence,
+        start_date=start,
+        end_date=datetime.datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None,
+        next_run_date=start,
+        runs_count=0,
+        due_days=due_days,
+        tax_rate=tax_rate,
+        currency=currency,
+        notes=notes,
+        active=True
+    )
+    count = min(len(descriptions), len(quantities), len(unit_prices))
+    for i in range(count):
+        if descriptions[i] and quantities[i] > 0:
+            schedule.line_items.append(RecurringLineItem(
+                description=descriptions[i],
+                quantity=quantities[i],
+                unit_price=unit_prices[i]
+            ))
+    db.add(schedule)
+    db.commit()
+    return RedirectResponse(url="/recurring", status_code=status.HTTP_303_SEE_OTHER)
+
+@router.post("/recurring/{id}/toggle")
+async def toggle_recurring(
+    request: Request,
+    id: int,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    schedule = repository.get_recurring_invoice(db, str(user.id), id)
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+
+    if schedule.active:
+        schedule.active = False
+    else:
+        # Resume from the next upcoming period instead of back-billing the pause
+        schedule.runs_count, schedule.next_run_date = next_period_from(schedule, date.today())
+        schedule.active = True
+    db.commit()
+    return RedirectResponse(url="/recurring", status_code=status.HTTP_303_SEE_OTHER)
+
+@router.post("/recurring/{id}/delete")
+async def delete_recurring(
+    request: Request,
+    id: int,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    schedule = repository.get_recurring_invoice(db, str(user.id), id)
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+
+    # Generated invoices stay; only the schedule and its run log go
+    db.query(RecurringInvoiceRun).filter(RecurringInvoiceRun.schedule_id == id).delete(synchronize_session=False)
+    db.delete(schedule)
+    db.commit()
+    return RedirectResponse(url="/recurring", status_code=status.HTTP_303_SEE_OTHER)
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi.responses import HTMLResponse
+from sqlalchemy.orm import Session
+from app.aging import aging_report
+from app.routes import get_current_user, get_active_subscription, get_tenant_db
+from app.templating import templates
+from typing import Any, Optional
+import datetime
+
+router = APIRouter()
+
+def parse_as_of(as_of):
+    if not as_of:
+        return None
+    try:
+        return datetime.datetime.strptime(as_of, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="as_of must be YYYY-MM-DD")
+
+@router.get("/reports/aging", response_class=HTMLResponse)
+async def aging_report_page(
+    request: Request,
+    as_of: Optional[str] = None,
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    report = aging_report(db, str(user.id), parse_as_of(as_of))
+    return templates.TemplateResponse("reports/aging.html", {"request": request, "user": user, "report": report})
+
+@router.get("/api/reports/aging")
+async def aging_report_json(
+    as_of: Optional[str] = None, # "YYYY-MM-DD", defaults to today
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    return aging_report(db, str(user.id), parse_as_of(as_of))
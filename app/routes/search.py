@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import HTMLResponse
+from sqlalchemy.orm import Session
+from app.routes import get_current_user, get_active_subscription, get_tenant_db
+from app.search import search
+from app.templating import templates
+from typing import Any
+
+router = APIRouter()
+
+@router.get("/search", response_class=HTMLResponse)
+async def search_page(
+    request: Request,
+    q: str = "",
+    db: Session = Depends(get_tenant_db),
+    user: Any = Depends(get_current_user),
+    sub: Any = Depends(get_active_subscription)
+):
+    results = search(db, str(user.id), q, limit=50) if q else []
+    return templates.TemplateResponse("search/results.html", {"request": request, "user": user, "q": q, "results": results})
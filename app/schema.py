@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import re
+from sqlalchemy import bindparam, func, inspect, select, text, update
+from sqlalchemy.schema import CreateTable
+from app.database import Base, SQLITE_SHARD_DIR, shard_engines
+
+# Columns added to tables that already exist in deployed databases, as
+# (table, column). create_all() only creates missing tables, so these are
+# added with ALTER TABLE and backfilled below.
+ADDED_COLUMNS = [
+    ("invoices", "user_id"),
+    ("invoices_archive", "user_id"),
+    ("financial_insights", "content_compressed"),
+    ("financial_insights", "preview"),
+    ("outbox_events", "uid"),
+    ("expenses", "updated_at"),
+    ("expenses_archive", "updated_at"),
+    ("insight_batch_items", "locked_until"),
+]
+
+BACKFILL_BATCH_SIZE = 1000
+
+# Hot tables whose rows move to an archive table keeping their ids, as
+# (table, archive table). On SQLite they are declared AUTOINCREMENT so a
+# deleted or archived row's id is never handed out again; tables created
+# before that are rebuilt once by ensure_autoincrement().
+AUTOINCREMENT_TABLES = [
+    ("invoices", "invoices_archive"),
+    ("line_items", "line_items_archive"),
+    ("expenses", "expenses_archive"),
+]
+
+# Written next to the shard files; tenants are bucketed by the shard count,
+# so it must never change once data exists
+SHARD_LAYOUT_FILE = os.path.join(SQLITE_SHARD_DIR, "layout.json")
+
+logger = logging.getLogger("app.schema")
+
+def tenant_tables():
+    # Tables defined in app.models. In sharded mode each shard has all of
+    # them; the main database keeps the rest (auth, billing).
+    import app.models
+    return [mapper.local_table for mapper in Base.registry.mappers if mapper.class_.__module__ == "app.models"]
+
+def check_schema(engine):
+    # Create missing tables and derived structures. Runs once per deployment
+    # (in the gunicorn master, see gunicorn.conf.py) or once per process when
+    # started directly with uvicorn.
+    # This includes User (from viv-auth), Billing tables (from viv-pay), and Invoice/Client/etc (from app.models)
+    # We must import app.models so models are registered in Base
+    import app.models
+
+    if not shard_engines:
+        Base.metadata.create_all(bind=engine)
+        migrate_tenant_schema(engine)
+        return
+
+    tenant = set(tenant_tables())
+    global_tables = [table for table in Base.metadata.sorted_tables if table not in tenant]
+    Base.metadata.create_all(bind=engine, tables=global_tables)
+    ensure_indexes(engine, global_tables)
+    check_shard_layout()
+    for shard in shard_engines:
+        Base.metadata.create_all(bind=shard, tables=list(tenant))
+        migrate_tenant_schema(shard, tenant)
+    if inspect(engine).has_table("clients") and not read_shard_layout().get("legacy_imported"):
+        with engine.connect() as conn:
+            if conn.execute(text("SELECT 1 FROM clients LIMIT 1")).first():
+                logger.warning("The main database still holds unsharded tenant data; copy it with `python -m app.shards import-legacy`")
+
+def migrate_tenant_schema(engine, tables=None):
+    # Column additions, backfills, indexes and derived structures for the
+    # tenant tables of one database (tables=None: every table in it)
+    from app.search import ensure_search_index
+    from app.rollups import ensure_rollups
+
+    ensure_columns(engine)
+    ensure_autoincrement(engine)
+    backfill_invoice_owners(engine)
+    backfill_insight_storage(engine)
+    ensure_indexes(engine, tables)
+    ensure_search_index(engine)
+    ensure_rollups(engine)
+
+def read_shard_layout():
+    if not os.path.exists(SHARD_LAYOUT_FILE):
+        return {}
+    with open(SHARD_LAYOUT_FILE) as f:
+        return json.load(f)
+
+def write_shard_layout(layout):
+    with open(SHARD_LAYOUT_FILE, "w") as f:
+        json.dump(layout, f)
+
+def check_shard_layout():
+    layout = read_shard_layout()
+    if not layout:
+        write_shard_layout({"shards": len(shard_engines)})
+    elif layout["shards"] != len(shard_engines):
+        raise RuntimeError(
+            f"{SHARD_LAYOUT_FILE} was created with SQLITE_SHARDS={layout['shards']}; "
+            f"changing it to {len(shard_engines)} would move tenants to other shards"
+        )
+
+def ensure_columns(engine):
+    inspector = inspect(engine)
+    for table_name, column_name in ADDED_COLUMNS:
+        if not inspector.has_table(table_name) or column_name in {c["name"] for c in inspector.get_columns(table_name)}:
+            continue
+        column = Base.metadata.tables[table_name].c[column_name]
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column.type.compile(engine.dialect)}"
+            ))
+
+def ensure_autoincrement(engine):
+    # SQLite can't add AUTOINCREMENT to an existing table, so copy it into a
+    # new one with the current definition and swap them (ids are kept, and
+    # ensure_indexes recreates the indexes). The sequence starts after the
+    # highest id in the table or its archive, since ids handed out before
+    # may only survive in the archive.
+    if engine.dialect.name != "sqlite":
+        return
+    for table_name, archive_name in AUTOINCREMENT_TABLES:
+        with engine.begin() as conn:
+            sql = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table_name}
+            ).scalar()
+            if sql is None or "AUTOINCREMENT" in sql.upper():
+                continue
+            table = Base.metadata.tables[table_name]
+            archive = Base.metadata.tables[archive_name]
+            rebuilt = f"{table_name}_rebuild"
+            ddl = str(CreateTable(table).compile(dialect=engine.dialect))
+            conn.execute(text(re.sub(rf"CREATE TABLE {table_name}\b", f"CREATE TABLE {rebuilt}", ddl, count=1)))
+            columns = ", ".join(column.name for column in table.columns)
+            conn.execute(text(f"INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {table_name}"))
+            conn.execute(text(f"DROP TABLE {table_name}"))
+            conn.execute(text(f"ALTER TABLE {rebuilt} RENAME TO {table_name}"))
+            floor = max(
+                conn.execute(select(func.max(table.c.id))).scalar() or 0,
+                (conn.execute(select(func.max(archive.c.id))).scalar() or 0) if inspect(conn).has_table(archive_name) else 0,
+            )
+            conn.execute(text("DELETE FROM sqlite_sequence WHERE name IN (:name, :rebuilt)"), {"name": table_name, "rebuilt": rebuilt})
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {"name": table_name, "seq": floor})
+        logger.info("Rebuilt %s with AUTOINCREMENT ids", table_name)
+
+def backfill_invoice_owners(engine, batch_size=BACKFILL_BATCH_SIZE):
+    # Copy clients.user_id onto invoices that predate Invoice.user_id, one
+    # committed batch at a time so a large table never holds one long write lock
+    from app.models import Client, Invoice, ArchivedInvoice
+
+    for table in (Invoice.__table__, ArchivedInvoice.__table__):
+        owner = select(Client.user_id).where(Client.id == table.c.client_id).scalar_subquery()
+        last_id = 0
+        while True:
+            with engine.begin() as conn:
+                ids = conn.execute(
+                    select(table.c.id)
+                    .where(table.c.user_id.is_(None), table.c.id > last_id)
+                    .order_by(table.c.id)
+                    .limit(batch_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                conn.execute(update(table).where(table.c.id.in_(ids)).values(user_id=owner))
+            last_id = ids[-1]
+
+def backfill_insight_storage(engine, batch_size=BACKFILL_BATCH_SIZE):
+    # Fill preview for insights stored before it existed and compress their
+    # large bodies, one committed batch at a time
+    from app.models import FinancialInsight
+
+    table = FinancialInsight.__table__
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.content)
+                .where(table.c.preview.is_(None), table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                insight = FinancialInsight()
+                insight.body = row.content
+                updates.append({
+                    "b_id": row.id,
+                    "b_content": insight.content,
+                    "b_content_compressed": insight.content_compressed,
+                    "b_preview": insight.preview,
+                })
+            conn.execute(
+                update(table).where(table.c.id == bindparam("b_id")).values(
+                    content=bindparam("b_content"),
+                    content_compressed=bindparam("b_content_compressed"),
+                    preview=bindparam("b_preview"),
+                ),
+                updates
+            )
+        last_id = rows[-1].id
+
+def ensure_indexes(engine, tables=None):
+    # create_all() only creates missing tables; indexes added to existing
+    # tables later are created here. An empty list means none: the main
+    # database of a sharded deployment may have no global tables registered
+    # (viv-auth and viv-pay models are only imported by app.main).
+    if tables is None:
+        tables = Base.metadata.sorted_tables
+    for table in tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
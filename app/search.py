@@ -0,0 +1,211 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, event, inspect, select, text
+from app.database import SessionLocal
+from app.models import Client, Invoice, LineItem, Expense
+
+# Full-text search over clients, invoices (number, notes and line item
+# descriptions) and expenses. Backed by an FTS5 virtual table on SQLite and a
+# tsvector column with a GIN index on Postgres; both live in `search_index`.
+#
+# Every document also carries an "owner" token derived from the tenant's
+# user_id in its own column, and every query is restricted to that column
+# (an FTS5 column filter on SQLite, an indexed equality on Postgres), so
+# tenant scoping happens inside the index query and text a tenant writes can
+# never match another tenant's owner.
+#
+# The index is kept in sync by an after_flush hook on SessionLocal. Writes
+# that bypass the ORM unit of work (bulk UPDATE/DELETE) must call
+# refresh_documents()/delete_documents() themselves.
+
+DOC_CLIENT = 1
+DOC_INVOICE = 2
+DOC_EXPENSE = 3
+DOC_TYPES = {DOC_CLIENT: "client", DOC_INVOICE: "invoice", DOC_EXPENSE: "expense"}
+
+BACKFILL_BATCH_SIZE = 1000
+
+def doc_key(doc_type, doc_id):
+    # rowid/primary key of a document; lets sync touch a document by key
+    return doc_id * 4 + doc_type
+
+def owner_token(user_id):
+    # Hex keeps arbitrary user ids (UUIDs, emails) a single index token
+    return "u" + str(user_id).encode().hex()
+
+def _is_sqlite(bind):
+    return bind.dialect.name == "sqlite"
+
+# The owner stays out of the tsvector: there it would be one more lexeme that
+# any tenant could also type into their own documents
+PG_TSV_COLUMN = (
+    "tsvector GENERATED ALWAYS AS ("
+    "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(body, ''))"
+    ") STORED"
+)
+
+def _drop_owner_from_tsv(conn):
+    # Indexes created before the owner moved out of the tsvector regenerate
+    # the column (and its GIN index) once
+    expression = conn.execute(text(
+        "SELECT generation_expression FROM information_schema.columns "
+        "WHERE table_name = 'search_index' AND column_name = 'tsv'"
+    )).scalar()
+    if expression and "owner" in expression:
+        conn.execute(text("ALTER TABLE search_index DROP COLUMN tsv"))
+        conn.execute(text(f"ALTER TABLE search_index ADD COLUMN tsv {PG_TSV_COLUMN}"))
+
+def ensure_search_index(engine):
+    # Create the index if needed and backfill it the first time it's created
+    created = not inspect(engine).has_table("search_index")
+    with engine.begin() as conn:
+        if _is_sqlite(engine):
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_index "
+                "USING fts5(owner, title, body, tokenize='unicode61 remove_diacritics 2')"
+            ))
+        else:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS search_index ("
+                " id BIGINT PRIMARY KEY,"
+                " owner VARCHAR NOT NULL,"
+                " title TEXT,"
+                " body TEXT,"
+                f" tsv {PG_TSV_COLUMN})"
+            ))
+            _drop_owner_from_tsv(conn)
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_search_index_tsv ON search_index USING GIN (tsv)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_search_index_owner ON search_index (owner)"))
+        if created:
+            rebuild_search_index(conn)
+
+def rebuild_search_index(conn):
+    conn.execute(text("DELETE FROM search_index"))
+    for doc_type, model in ((DOC_CLIENT, Client), (DOC_INVOICE, Invoice), (DOC_EXPENSE, Expense)):
+        last_id = 0
+        while True:
+            ids = conn.execute(
+                select(model.id).where(model.id > last_id).order_by(model.id).limit(BACKFILL_BATCH_SIZE)
+            ).scalars().all()
+            if not ids:
+                break
+            _insert_documents(conn, doc_type, ids)
+            last_id = ids[-1]
+
+def _load_documents(conn, doc_type, ids):
+    # Returns [(doc_id, user_id, title, body)] for the given source rows
+    if doc_type == DOC_CLIENT:
+        rows = conn.execute(
+            select(Client.id, Client.user_id, Client.name, Client.email, Client.tax_id).where(Client.id.in_(ids))
+        )
+        return [(r.id, r.user_id, r.name, " ".join(filter(None, [r.email, r.tax_id]))) for r in rows]
+    if doc_type == DOC_INVOICE:
+        descriptions = {}
+        for invoice_id, description in conn.execute(
+            select(LineItem.invoice_id, LineItem.description).where(LineItem.invoice_id.in_(ids))
+        ):
+            descriptions.setdefault(invoice_id, []).append(description)
+        rows = conn.execute(
+            select(Invoice.id, Invoice.user_id, Invoice.invoice_number, Invoice.notes).where(Invoice.id.in_(ids))
+        )
+        return [
+            (r.id, r.user_id, r.invoice_number, " ".join(filter(None, [r.notes] + descriptions.get(r.id, []))))
+            for r in rows
+        ]
+    rows = conn.execute(
+        select(Expense.id, Expense.user_id, Expense.description, Expense.vendor).where(Expense.id.in_(ids))
+    )
+    return [(r.id, r.user_id, r.description, r.vendor or "") for r in rows]
+
+def _insert_documents(conn, doc_type, ids):
+    docs = [
+        {"id": doc_key(doc_type, doc_id), "owner": owner_token(user_id), "title": title, "body": body}
+        for doc_id, user_id, title, body in _load_documents(conn, doc_type, ids)
+    ]
+    if not docs:
+        return
+    key_column = "rowid" if _is_sqlite(conn) else "id"
+    conn.execute(
+        text(f"INSERT INTO search_index ({key_column}, owner, title, body) VALUES (:id, :owner, :title, :body)"),
+        docs
+    )
+
+def delete_documents(conn, doc_type, ids):
+    if not ids:
+        return
+    key_column = "rowid" if _is_sqlite(conn) else "id"
+    conn.execute(
+        text(f"DELETE FROM search_index WHERE {key_column} IN :keys").bindparams(bindparam("keys", expanding=True)),
+        {"keys": [doc_key(doc_type, doc_id) for doc_id in ids]}
+    )
+
+def refresh_documents(conn, doc_type, ids):
+    ids = list(ids)
+    delete_documents(conn, doc_type, ids)
+    if ids:
+        _insert_documents(conn, doc_type, ids)
+
+@event.listens_for(SessionLocal, "after_flush")
+def _sync_search_index(session, flush_context):
+    changed = {DOC_CLIENT: set(), DOC_INVOICE: set(), DOC_EXPENSE: set()}
+    deleted = {DOC_CLIENT: set(), DOC_INVOICE: set(), DOC_EXPENSE: set()}
+    for objects, target in ((session.new, changed), (session.dirty, changed), (session.deleted, deleted)):
+        for obj in objects:
+            if isinstance(obj, Client):
+                target[DOC_CLIENT].add(obj.id)
+            elif isinstance(obj, Invoice):
+                target[DOC_INVOICE].add(obj.id)
+            elif isinstance(obj, Expense):
+                target[DOC_EXPENSE].add(obj.id)
+            elif isinstance(obj, LineItem) and obj.invoice_id is not None:
+                # Line items are indexed as part of their invoice
+                changed[DOC_INVOICE].add(obj.invoice_id)
+    if not any(changed.values()) and not any(deleted.values()):
+        return
+    conn = session.connection()
+    for doc_type in DOC_TYPES:
+        delete_documents(conn, doc_type, deleted[doc_type])
+        refresh_documents(conn, doc_type, changed[doc_type] - deleted[doc_type])
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())[:10]
+
+def _highlight(snippet):
+    # Index text is user data; escape it, then turn the \x02/\x03 markers into <mark>
+    return Markup(str(escape(snippet or "")).replace("\x02", "<mark>").replace("\x03", "</mark>"))
+
+def search(db, user_id, query, limit=20):
+    terms = _terms(query)
+    if not terms:
+        return []
+    owner = owner_token(user_id)
+    if _is_sqlite(db.get_bind()):
+        # Quote every term and prefix-match it: "shop"* "integ"*
+        match = f"owner:{owner} AND (" + " ".join(f'"{t}"*' for t in terms) + ")"
+        rows = db.execute(text(
+            "SELECT rowid AS id, title, snippet(search_index, 2, char(2), char(3), '…', 12) AS snippet "
+            "FROM search_index WHERE search_index MATCH :match ORDER BY bm25(search_index) LIMIT :limit"
+        ), {"match": match, "limit": limit})
+    else:
+        tsquery = " & ".join(f"{t}:*" for t in terms)
+        rows = db.execute(text(
+            "SELECT s.id, s.title, ts_headline('simple', s.body, to_tsquery('simple', :tsquery),"
+            " 'StartSel=\x02, StopSel=\x03, MaxWords=20, MinWords=5') AS snippet "
+            "FROM (SELECT id, title, body, ts_rank(tsv, to_tsquery('simple', :tsquery)) AS rank"
+            "      FROM search_index WHERE owner = :owner AND tsv @@ to_tsquery('simple', :tsquery)"
+            "      ORDER BY rank DESC LIMIT :limit) s "
+            "ORDER BY s.rank DESC"
+        ), {"owner": owner, "tsquery": tsquery, "limit": limit})
+    results = []
+    for row in rows:
+        doc_type, doc_id = row.id % 4, row.id // 4
+        kind = DOC_TYPES[doc_type]
+        url = f"/expenses/{doc_id}/edit" if doc_type == DOC_EXPENSE else f"/{kind}s/{doc_id}"
+        results.append({
+            "type": kind,
+            "id": doc_id,
+            "title": row.title,
+            "snippet": _highlight(row.snippet),
+            "url": url,
+        })
+    return results
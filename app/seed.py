@@ -38,6 +38,7 @@ def seed_data(db: Session, user_id: str):
     for i, data in enumerate(invoices_data):
         cid = data.pop("client_id")
         data["client_id"] = client_map[cid].id
+        data["user_id"] = user_id
         data["issue_date"] = datetime.datetime.strptime(data["issue_date"], "%Y-%m-%d").date()
         data["due_date"] = datetime.datetime.strptime(data["due_date"], "%Y-%m-%d").date()
         if "paid_date" in data:
@@ -100,6 +101,7 @@ def seed_data(db: Session, user_id: str):
     for data in insights_data:
         if data.get("requested_by") == "system":
             data["requested_by"] = str(user_id)
+        data["body"] = data.pop("content")
         db.add(FinancialInsight(**data))
 
     db.commit()
@@ -0,0 +1,209 @@
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, inspect, select
+from app.database import Base, SQLITE_SHARDS, engine, insert_ignoring_conflicts, shard_engines, shard_index
+from app.models import Client, Invoice, Expense
+from app.aging import OPEN_STATUSES
+from app.purge import TOMBSTONE_PREFIX
+from app import rollups, schema, search
+
+# Admin commands for SQLite sharding (SQLITE_SHARDS, see app.database):
+#   python -m app.shards migrate            # create/upgrade the main db and every shard
+#   python -m app.shards status             # per-shard and merged counts and totals
+#   python -m app.shards locate <user_id>   # which file holds a tenant
+#   python -m app.shards import-legacy      # copy unsharded tenant data into the shards
+#
+# Tenants are hash-bucketed by user_id, so the shard count is fixed once data
+# exists (schema.check_shard_layout refuses to start with a different one);
+# there is no online resharding.
+
+IMPORT_BATCH_SIZE = 1000
+
+# How import-legacy routes each tenant table: by its owner column, through its
+# parent's owner, or to every shard
+OWNER_COLUMNS = {
+    "clients": "user_id",
+    "invoices": "user_id",
+    "invoices_archive": "user_id",
+    "expenses": "user_id",
+    "expenses_archive": "user_id",
+    "financial_insights": "requested_by",
+    "recurring_invoices": "user_id",
+    "outbox_events": "user_id",
+}
+# child table: (foreign key column, parent table)
+CHILD_TABLES = {
+    "line_items": ("invoice_id", "invoices"),
+    "line_items_archive": ("invoice_id", "invoices_archive"),
+    "recurring_line_items": ("schedule_id", "recurring_invoices"),
+    "recurring_invoice_runs": ("schedule_id", "recurring_invoices"),
+    "webhook_deliveries": ("event_id", "outbox_events"),
+}
+# Numbering continues after the highest legacy number on every shard
+COPY_TO_ALL_SHARDS = {"invoice_sequences"}
+# Rebuilt on each shard after the import (rollups) or per-database job state
+NOT_IMPORTED = {"monthly_rollups", "insight_batch_runs", "insight_batch_items"}
+
+logger = logging.getLogger("app.shards")
+
+def shard_path(index):
+    return shard_engines[index].url.database
+
+def _owner_shard(owner):
+    # Hidden clients awaiting purge carry a tombstone owner; they belong with
+    # their real owner. Rows without an owner go to the first shard.
+    if owner is None:
+        return 0
+    if owner.startswith(TOMBSTONE_PREFIX):
+        owner = owner[len(TOMBSTONE_PREFIX):]
+    return shard_index(owner)
+
+def shard_stats(bind):
+    # Counts and per-currency totals for one database
+    with bind.connect() as conn:
+        stats = {
+            "tenants": conn.execute(select(func.count(func.distinct(Client.user_id)))).scalar(),
+            "clients": conn.execute(select(func.count(Client.id))).scalar(),
+            "invoices": conn.execute(select(func.count(Invoice.id))).scalar(),
+            "expenses": conn.execute(select(func.count(Expense.id))).scalar(),
+            "receivables": {},
+            "revenue": {},
+        }
+        totals = conn.execute(
+            select(Invoice.status, Invoice.currency, func.sum(Invoice.total))
+            .where(Invoice.status.in_(OPEN_STATUSES + ("paid",)))
+            .group_by(Invoice.status, Invoice.currency)
+        )
+        for status, currency, amount in totals:
+            bucket = stats["revenue"] if status == "paid" else stats["receivables"]
+            bucket[currency] = bucket.get(currency, 0.0) + (amount or 0.0)
+    return stats
+
+def merge_stats(all_stats):
+    merged = {"tenants": 0, "clients": 0, "invoices": 0, "expenses": 0, "receivables": {}, "revenue": {}}
+    for stats in all_stats:
+        for key in ("tenants", "clients", "invoices", "expenses"):
+            merged[key] += stats[key]
+        for key in ("receivables", "revenue"):
+            for currency, amount in stats[key].items():
+                merged[key][currency] = merged[key].get(currency, 0.0) + amount
+    return merged
+
+def collect_stats():
+    # Shards are independent files, so they are queried in parallel
+    with ThreadPoolExecutor(max_workers=min(len(shard_engines), 8)) as executor:
+        return list(executor.map(shard_stats, shard_engines))
+
+def _format_amounts(amounts):
+    return ", ".join(f"{currency} {amount:,.2f}" for currency, amount in sorted(amounts.items())) or "-"
+
+def print_status():
+    all_stats = collect_stats()
+    rows = [(str(i), stats) for i, stats in enumerate(all_stats)] + [("all", merge_stats(all_stats))]
+    for label, stats in rows:
+        size = f"{os.path.getsize(shard_path(int(label))) / 1048576:8.1f} MB" if label != "all" else " " * 11
+        print(
+            f"{label:>4} {size} tenants={stats['tenants']} clients={stats['clients']} "
+            f"invoices={stats['invoices']} expenses={stats['expenses']} "
+            f"receivables={_format_amounts(stats['receivables'])} revenue={_format_amounts(stats['revenue'])}"
+        )
+
+def _import_table(table, batch_size):
+    # Copies one table from the main database in primary key order, keeping
+    # ids (they are unique in the main database, so they can't collide
+    # across shards). Conflicts are ignored, so an interrupted import can be
+    # run again.
+    key = list(table.primary_key.columns)[0]
+    if table.name in COPY_TO_ALL_SHARDS:
+        owner, source = None, table
+    elif table.name in OWNER_COLUMNS:
+        owner, source = table.c[OWNER_COLUMNS[table.name]], table
+    else:
+        column, parent_name = CHILD_TABLES[table.name]
+        parent = Base.metadata.tables[parent_name]
+        owner, source = parent.c[OWNER_COLUMNS[parent_name]], table.join(parent, table.c[column] == parent.c.id)
+
+    columns = list(table.columns)
+    stmt = select(*columns) if owner is None else select(*columns, owner.label("shard_owner"))
+    stmt = stmt.select_from(source).order_by(key).limit(batch_size)
+    copied = 0
+    last_key = None
+    while True:
+        with engine.connect() as conn:
+            page = stmt if last_key is None else stmt.where(key > last_key)
+            rows = conn.execute(page).mappings().all()
+        if not rows:
+            return copied
+        buckets = {}
+        for row in rows:
+            values = {column.name: row[column.name] for column in columns}
+            targets = range(len(shard_engines)) if owner is None else [_owner_shard(row["shard_owner"])]
+            for index in targets:
+                buckets.setdefault(index, []).append(values)
+        for index, values in buckets.items():
+            with shard_engines[index].begin() as conn:
+                conn.execute(insert_ignoring_conflicts(conn, table), values)
+        copied += len(rows)
+        last_key = rows[-1][key.name]
+
+def import_legacy(batch_size=IMPORT_BATCH_SIZE):
+    # Returns {table name: rows copied}
+    layout = schema.read_shard_layout()
+    if layout.get("legacy_imported"):
+        raise RuntimeError("Legacy data was already imported")
+    present = set(inspect(engine).get_table_names())
+    tenant = set(schema.tenant_tables())
+    unrouted = {t.name for t in tenant} - set(OWNER_COLUMNS) - set(CHILD_TABLES) - COPY_TO_ALL_SHARDS - NOT_IMPORTED
+    if unrouted:
+        raise RuntimeError(f"No import route for tenant tables: {', '.join(sorted(unrouted))}")
+    if not layout.get("legacy_import_started"):
+        # Kept ids would collide with rows created on the shards since
+        if any(stats["clients"] or stats["invoices"] or stats["expenses"] for stats in collect_stats()):
+            raise RuntimeError("The shards already hold tenant data; import before serving traffic")
+        schema.write_shard_layout({**layout, "legacy_import_started": True})
+
+    # Bring an older main database up to the current columns first
+    schema.ensure_columns(engine)
+    schema.backfill_invoice_owners(engine)
+    schema.backfill_insight_storage(engine)
+
+    copied = {}
+    for table in Base.metadata.sorted_tables:
+        if table in tenant and table.name in present and table.name not in NOT_IMPORTED:
+            copied[table.name] = _import_table(table, batch_size)
+            logger.info("Imported %s rows of %s", copied[table.name], table.name)
+    for bind in shard_engines:
+        with bind.begin() as conn:
+            rollups.backfill(conn)
+            search.rebuild_search_index(conn)
+    schema.write_shard_layout({**schema.read_shard_layout(), "legacy_imported": True})
+    return copied
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the SQLite tenant shards")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("migrate", help="create and upgrade the main database and every shard")
+    subparsers.add_parser("status", help="per-shard and merged counts and totals")
+    locate = subparsers.add_parser("locate", help="print the shard holding a tenant")
+    locate.add_argument("user_id")
+    legacy = subparsers.add_parser("import-legacy", help="copy tenant data from the main database into the shards")
+    legacy.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not SQLITE_SHARDS:
+        parser.error("SQLITE_SHARDS is not set")
+
+    if args.command == "locate":
+        index = shard_index(args.user_id)
+        print(f"{index} {shard_path(index)}")
+    else:
+        schema.check_schema(engine)
+        if args.command == "migrate":
+            print(f"Main database and {len(shard_engines)} shards are up to date")
+        elif args.command == "status":
+            print_status()
+        else:
+            copied = import_legacy(args.batch_size)
+            print(f"Imported {sum(copied.values())} rows into {len(shard_engines)} shards")
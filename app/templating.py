@@ -0,0 +1,9 @@
+from fastapi.templating import Jinja2Templates
+from app.timing import SERVER_TIMING_ENABLED, TimedTemplate
+
+# One shared Jinja environment for every router, so templates are compiled
+# and cached once per process instead of once per router.
+templates = Jinja2Templates(directory="app/templates")
+
+if SERVER_TIMING_ENABLED:
+    templates.env.template_class = TimedTemplate
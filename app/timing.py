@@ -0,0 +1,33 @@
+import os
+import time
+from contextvars import ContextVar
+from jinja2 import Template
+
+# Per-request timing (query count, DB time, template render time) reported via
+# the Server-Timing header. Off by default; nothing is hooked up unless enabled.
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+class RequestTimings:
+    __slots__ = ("query_count", "db_time", "template_time")
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+# Set by the middleware in app.main for the duration of a request. Sync
+# dependencies run in the threadpool with a copy of the context, so they see
+# (and mutate) the same RequestTimings object.
+current_timings: ContextVar = ContextVar("current_timings", default=None)
+
+class TimedTemplate(Template):
+    # Jinja template that adds its render time to the current request's timings
+    def render(self, *args, **kwargs):
+        timings = current_timings.get()
+        if timings is None:
+            return super().render(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            timings.template_time += time.perf_counter() - start
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+import httpx
+from sqlalchemy import bindparam, delete, exists, or_, select, update
+from app.database import engine, insert_ignoring_conflicts, tenant_engines
+from app.models import OutboxEvent, WebhookDelivery
+from app import metrics
+
+# Background delivery of outbox events (app.outbox) to the ERP and any other
+# endpoint listed in WEBHOOK_ENDPOINTS (comma-separated URLs). Run it as its
+# own process:
+#   python -m app.webhooks            # poll forever
+#   python -m app.webhooks --once     # one batch, e.g. from cron or a test
+# or inside each web worker with WEBHOOK_DISPATCH_IN_APP=1.
+#
+# Each pass fans new events out into one webhook_deliveries row per endpoint,
+# claims a batch of due deliveries with a lease (locked_until) so several
+# dispatchers never send the same one concurrently, POSTs them with at most
+# WEBHOOK_CONCURRENCY_PER_ENDPOINT requests in flight per endpoint, and
+# records every result in one executemany UPDATE. Failures are retried with
+# exponential backoff and jitter until WEBHOOK_MAX_ATTEMPTS, then marked
+# "failed". Outbox tables live with the tenant data, so with SQLite sharding
+# a pass covers each shard in turn.
+#
+# Events whose deliveries have all finished (delivered or failed) are deleted
+# WEBHOOK_RETENTION_DAYS after fan-out, checked at most once per
+# WEBHOOK_PRUNE_INTERVAL seconds per database.
+#
+# Delivery is at-least-once and not ordered: receivers should de-duplicate on
+# X-Webhook-Id (the event's uid) and order one invoice's events by "sequence".
+#
+# Requests are signed with WEBHOOK_SECRET when set:
+#   X-Webhook-Signature: sha256=HMAC(secret, "<X-Webhook-Timestamp>.<body>")
+
+WEBHOOK_ENDPOINTS = [url.strip() for url in os.environ.get("WEBHOOK_ENDPOINTS", "").split(",") if url.strip()]
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_DISPATCH_IN_APP = os.environ.get("WEBHOOK_DISPATCH_IN_APP", "") == "1"
+
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", "100"))
+WEBHOOK_CONCURRENCY_PER_ENDPOINT = int(os.environ.get("WEBHOOK_CONCURRENCY_PER_ENDPOINT", "4"))
+WEBHOOK_TIMEOUT = float(os.environ.get("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "10"))
+WEBHOOK_BACKOFF_BASE = float(os.environ.get("WEBHOOK_BACKOFF_BASE", "30")) # seconds before the first retry
+WEBHOOK_BACKOFF_MAX = float(os.environ.get("WEBHOOK_BACKOFF_MAX", "3600"))
+WEBHOOK_POLL_INTERVAL = float(os.environ.get("WEBHOOK_POLL_INTERVAL", "5"))
+WEBHOOK_RETENTION_DAYS = float(os.environ.get("WEBHOOK_RETENTION_DAYS", "14"))
+WEBHOOK_PRUNE_INTERVAL = float(os.environ.get("WEBHOOK_PRUNE_INTERVAL", "3600"))
+
+PRUNE_BATCH_SIZE = 1000
+# Room for the claim and record transactions on top of the sends
+LEASE_MARGIN_SECONDS = 60
+
+# Last prune per database (engine url), for this process
+_last_pruned = {}
+
+logger = logging.getLogger("app.webhooks")
+
+def backoff_seconds(attempts):
+    # Delay after the attempts-th failure: base * 2^(attempts - 1), capped,
+    # with jitter so retries to a recovering endpoint don't arrive in lockstep
+    delay = min(WEBHOOK_BACKOFF_MAX, WEBHOOK_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+def sign(secret, timestamp, body):
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+def fan_out(conn, endpoints, batch_size, now):
+    # Returns the number of events fanned out. The unique (event_id, endpoint)
+    # index makes a concurrent fan-out of the same events harmless.
+    event_ids = conn.execute(
+        select(OutboxEvent.id).where(OutboxEvent.fanned_out_at.is_(None)).order_by(OutboxEvent.id).limit(batch_size)
+    ).scalars().all()
+    if not event_ids:
+        return 0
+    conn.execute(insert_ignoring_conflicts(conn, WebhookDelivery), [
+        {"event_id": event_id, "endpoint": endpoint, "status": "pending", "attempts": 0, "next_attempt_at": now}
+        for event_id in event_ids
+        for endpoint in endpoints
+    ])
+    conn.execute(update(OutboxEvent).where(OutboxEvent.id.in_(event_ids)).values(fanned_out_at=now))
+    return len(event_ids)
+
+def lease_seconds(batch_size):
+    # A claimed batch must be sent and recorded within the lease, or another
+    # dispatcher may pick it up again. Each request is capped at
+    # WEBHOOK_TIMEOUT in total (see send), and one endpoint gets at most
+    # WEBHOOK_CONCURRENCY_PER_ENDPOINT at a time, so a batch that all goes to
+    # one endpoint takes at most this many rounds.
+    rounds = math.ceil(batch_size / WEBHOOK_CONCURRENCY_PER_ENDPOINT)
+    return rounds * WEBHOOK_TIMEOUT + LEASE_MARGIN_SECONDS
+
+def claim_batch(conn, batch_size, now):
+    unlocked = or_(WebhookDelivery.locked_until.is_(None), WebhookDelivery.locked_until < now)
+    due = conn.execute(
+        select(WebhookDelivery.id)
+        .where(WebhookDelivery.status == "pending", WebhookDelivery.next_attempt_at <= now, unlocked)
+        .order_by(WebhookDelivery.next_attempt_at, WebhookDelivery.id)
+        .limit(batch_size)
+    ).scalars().all()
+    if not due:
+        return []
+    # Re-checks the lease, so a delivery claimed by another dispatcher since
+    # the SELECT is left out
+    claimed = conn.execute(
+        update(WebhookDelivery)
+        .where(WebhookDelivery.id.in_(due), unlocked)
+        .values(locked_until=now + timedelta(seconds=lease_seconds(batch_size)))
+        .returning(WebhookDelivery.id)
+    ).scalars().all()
+    if not claimed:
+        return []
+    return conn.execute(
+        select(
+            WebhookDelivery.id, WebhookDelivery.endpoint, WebhookDelivery.attempts,
+            OutboxEvent.id.label("event_id"), OutboxEvent.uid, OutboxEvent.event_type, OutboxEvent.payload, OutboxEvent.created_at,
+        )
+        .join(OutboxEvent, WebhookDelivery.event_id == OutboxEvent.id)
+        .where(WebhookDelivery.id.in_(claimed))
+        .order_by(OutboxEvent.id)
+    ).all()
+
+def record_results(conn, results, now):
+    # results: [(delivery row, status code or None, error or None)]
+    updates = []
+    for delivery, status_code, error in results:
+        attempts = delivery.attempts + 1
+        if error is None:
+            status, next_attempt_at = "delivered", now
+        elif attempts >= WEBHOOK_MAX_ATTEMPTS:
+            status, next_attempt_at = "failed", now
+        else:
+            status, next_attempt_at = "pending", now + timedelta(seconds=backoff_seconds(attempts))
+        metrics.WEBHOOK_DELIVERIES.labels(result="retry" if status == "pending" else status).inc()
+        updates.append({
+            "b_id": delivery.id,
+            "b_status": status,
+            "b_attempts": attempts,
+            "b_next_attempt_at": next_attempt_at,
+            "b_status_code": status_code,
+            "b_error": error[:2000] if error else None,
+            "b_delivered_at": now if status == "delivered" else None,
+        })
+    if updates:
+        conn.execute(
+            update(WebhookDelivery).where(WebhookDelivery.id == bindparam("b_id")).values(
+                status=bindparam("b_status"),
+                attempts=bindparam("b_attempts"),
+                next_attempt_at=bindparam("b_next_attempt_at"),
+                locked_until=None,
+                last_status_code=bindparam("b_status_code"),
+                last_error=bindparam("b_error"),
+                delivered_at=bindparam("b_delivered_at"),
+            ),
+            updates
+        )
+
+def prune(conn, cutoff, batch_size=PRUNE_BATCH_SIZE):
+    # Deletes up to batch_size events fanned out before cutoff that have no
+    # pending delivery, with their deliveries; returns the number deleted
+    pending = exists().where(WebhookDelivery.event_id == OutboxEvent.id, WebhookDelivery.status == "pending")
+    event_ids = conn.execute(
+        select(OutboxEvent.id)
+        .where(OutboxEvent.fanned_out_at < cutoff, ~pending)
+        .order_by(OutboxEvent.id)
+        .limit(batch_size)
+    ).scalars().all()
+    if event_ids:
+        conn.execute(delete(WebhookDelivery).where(WebhookDelivery.event_id.in_(event_ids)))
+        conn.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(event_ids)))
+    return len(event_ids)
+
+def prune_finished(bind, now=None):
+    # Batched so a large backlog never holds one long write lock
+    cutoff = (now or datetime.utcnow()) - timedelta(days=WEBHOOK_RETENTION_DAYS)
+    total = 0
+    while True:
+        with bind.begin() as conn:
+            deleted = prune(conn, cutoff)
+        total += deleted
+        if deleted < PRUNE_BATCH_SIZE:
+            return total
+
+def _prune_if_due(bind):
+    key = str(bind.url)
+    now = time.monotonic()
+    if now - _last_pruned.get(key, float("-inf")) < WEBHOOK_PRUNE_INTERVAL:
+        return 0
+    _last_pruned[key] = now
+    return prune_finished(bind)
+
+def event_uid(delivery):
+    # Events recorded before uids existed are only unique in the main database
+    return delivery.uid or str(delivery.event_id)
+
+def _request_body(delivery):
+    created_at = delivery.created_at.isoformat() if delivery.created_at else None
+    return json.dumps({
+        "id": event_uid(delivery),
+        "sequence": delivery.event_id,
+        "type": delivery.event_type,
+        "created_at": created_at,
+        "data": json.loads(delivery.payload),
+    }).encode()
+
+async def send(client, semaphore, delivery, secret):
+    # Returns (delivery, status code or None, error or None)
+    body = _request_body(delivery)
+    timestamp = str(int(time.time()))
+    headers = {
+        "Content-Type": "application/json",
+        "X-Webhook-Id": event_uid(delivery),
+        "X-Webhook-Event": delivery.event_type,
+        "X-Webhook-Timestamp": timestamp,
+    }
+    if secret:
+        headers["X-Webhook-Signature"] = sign(secret, timestamp, body)
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            # httpx applies its timeout to each phase separately; this caps
+            # the whole request, which lease_seconds relies on
+            response = await asyncio.wait_for(
+                client.post(delivery.endpoint, content=body, headers=headers), WEBHOOK_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            return delivery, None, f"Timed out after {WEBHOOK_TIMEOUT:g}s"
+        except httpx.HTTPError as exc:
+            return delivery, None, f"{type(exc).__name__}: {exc}"
+        finally:
+            metrics.WEBHOOK_LATENCY.observe(time.perf_counter() - start)
+    if response.is_success:
+        return delivery, response.status_code, None
+    return delivery, response.status_code, f"HTTP {response.status_code}: {response.text[:500]}"
+
+def _fan_out_and_claim(bind, endpoints, batch_size):
+    _prune_if_due(bind)
+    with bind.begin() as conn:
+        fan_out(conn, endpoints, batch_size, datetime.utcnow())
+    with bind.begin() as conn:
+        return claim_batch(conn, batch_size, datetime.utcnow())
+
+def _record(bind, results):
+    with bind.begin() as conn:
+        record_results(conn, results, datetime.utcnow())
+
+async def dispatch_once(client, bind, endpoints=None, batch_size=WEBHOOK_BATCH_SIZE, secret=None):
+    # One pass over one database; returns the number of deliveries attempted.
+    # Database work runs in a thread so an in-app dispatcher doesn't block
+    # the event loop.
+    endpoints = WEBHOOK_ENDPOINTS if endpoints is None else endpoints
+    secret = WEBHOOK_SECRET if secret is None else secret
+    if not endpoints:
+        return 0
+    batch = await asyncio.to_thread(_fan_out_and_claim, bind, endpoints, batch_size)
+    if not batch:
+        return 0
+    semaphores = {
+        endpoint: asyncio.Semaphore(WEBHOOK_CONCURRENCY_PER_ENDPOINT)
+        for endpoint in {delivery.endpoint for delivery in batch}
+    }
+    results = await asyncio.gather(*[
+        send(client, semaphores[delivery.endpoint], delivery, secret) for delivery in batch
+    ])
+    await asyncio.to_thread(_record, bind, results)
+    return len(batch)
+
+async def dispatch_all(client, endpoints=None, batch_size=WEBHOOK_BATCH_SIZE, binds=None):
+    # One pass over every shard; returns the deliveries attempted per shard
+    return [await dispatch_once(client, bind, endpoints, batch_size) for bind in binds or tenant_engines()]
+
+async def run_dispatcher(stop=None, binds=None, endpoints=None, batch_size=WEBHOOK_BATCH_SIZE, transport=None):
+    # Polls until `stop` (an asyncio.Event) is set. A full batch means more is
+    # probably due, so the next pass starts right away.
+    stop = stop or asyncio.Event()
+    async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT, transport=transport) as client:
+        while not stop.is_set():
+            try:
+                sent = max(await dispatch_all(client, endpoints, batch_size, binds))
+            except Exception:
+                logger.exception("Webhook dispatch pass failed")
+                sent = 0
+            if sent < batch_size:
+                try:
+                    await asyncio.wait_for(stop.wait(), WEBHOOK_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+async def _dispatch_pending(batch_size):
+    total = 0
+    async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT) as client:
+        while True:
+            sent = await dispatch_all(client, batch_size=batch_size)
+            total += sum(sent)
+            if max(sent) < batch_size:
+                return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deliver outbox events to the configured webhook endpoints")
+    parser.add_argument("--once", action="store_true", help="deliver everything currently due, then exit")
+    parser.add_argument("--batch-size", type=int, default=WEBHOOK_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not WEBHOOK_ENDPOINTS:
+        parser.error("WEBHOOK_ENDPOINTS is not set")
+    from app.schema import check_schema
+    check_schema(engine)
+    if args.once:
+        print(f"Attempted {asyncio.run(_dispatch_pending(args.batch_size))} deliveries")
+    else:
+        asyncio.run(run_dispatcher(batch_size=args.batch_size))
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import tracemalloc
+
+# Time and peak memory to load a list page's rows as ORM objects versus the
+# slotted rows from app.projections. Runs against a throwaway in-memory
+# SQLite database:
+#   python benchmarks/list_projections.py [rows]
+
+os.environ["DATABASE_URL"] = "sqlite://"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from datetime import date, timedelta
+from sqlalchemy import desc, insert
+from sqlalchemy.orm import joinedload
+from app.database import Base, SessionLocal, engine
+from app.models import Client, Invoice, Expense
+from app import projections
+
+def setup(rows):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Client), [
+            {"id": i, "user_id": "1", "name": f"Client {i}", "email": f"c{i}@example.com", "address": "x" * 200, "notes": "n" * 500}
+            for i in range(1, 51)
+        ])
+        conn.execute(insert(Invoice), [
+            {
+                "client_id": i % 50 + 1, "user_id": "1", "invoice_number": f"BENCH-{i}", "status": "sent",
+                "issue_date": date(2026, 1, 1) + timedelta(days=i % 300), "due_date": date(2026, 2, 1),
+                "total": 100.0 + i, "notes": "n" * 500,
+            }
+            for i in range(rows)
+        ])
+        conn.execute(insert(Expense), [
+            {"user_id": "1", "category": "software", "description": f"Expense {i}", "amount": 10.0 + i, "date": date(2026, 1, 1), "vendor": "Vendor"}
+            for i in range(rows)
+        ])
+
+def measure(load):
+    # Returns (seconds, peak bytes) for loading and rendering-style access
+    db = SessionLocal()
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        rows = load(db)
+        for row in rows:
+            row.id
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, peak
+    finally:
+        db.close()
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    setup(rows)
+
+    def orm_invoices(db):
+        return db.query(Invoice).options(joinedload(Invoice.client)).filter(Invoice.user_id == "1").order_by(desc(Invoice.issue_date)).all()
+
+    def orm_expenses(db):
+        return db.query(Expense).filter(Expense.user_id == "1").order_by(desc(Expense.date)).all()
+
+    for label, baseline, projected in (
+        ("invoices", orm_invoices, lambda db: projections.list_invoices(db, "1")),
+        ("expenses", orm_expenses, lambda db: projections.list_expenses(db, "1")),
+    ):
+        measure(projected) # warm the statement cache for both
+        measure(baseline)
+        base_time, base_peak = measure(baseline)
+        fast_time, fast_peak = measure(projected)
+        print(
+            f"{label:8} {rows} rows  ORM {base_time * 1000:7.1f} ms {base_peak / 1048576:6.1f} MB   "
+            f"projection {fast_time * 1000:7.1f} ms {fast_peak / 1048576:6.1f} MB"
+        )
+
+if __name__ == "__main__":
+    main()
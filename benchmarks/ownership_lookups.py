@@ -0,0 +1,54 @@
+import os
+import sys
+import timeit
+
+# Per-call cost of an ownership lookup built with the Query API on every call
+# versus the cached lambda statements in app.repository. Runs against a
+# throwaway in-memory SQLite database:
+#   python benchmarks/ownership_lookups.py [iterations]
+
+os.environ["DATABASE_URL"] = "sqlite://"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from datetime import date
+from app.database import Base, SessionLocal, engine
+from app.models import Client, Invoice
+from app import repository
+
+def setup():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    client = Client(user_id="1", name="Bench Co", email="bench@example.com")
+    client.invoices.append(Invoice(invoice_number="BENCH-1", issue_date=date.today(), due_date=date.today(), total=100.0))
+    db.add(client)
+    db.commit()
+    return db, client.invoices[0].id, client.id
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    db, invoice_id, client_id = setup()
+    user_id = "1"
+
+    def query_invoice():
+        return db.query(Invoice).filter(Invoice.id == invoice_id, Invoice.user_id == user_id).first()
+
+    def repository_invoice():
+        return repository.get_invoice(db, user_id, invoice_id)
+
+    def query_client():
+        return db.query(Client).filter(Client.id == client_id, Client.user_id == user_id).first()
+
+    def repository_client():
+        return repository.get_client(db, user_id, client_id)
+
+    for label, baseline, cached in (
+        ("invoice", query_invoice, repository_invoice),
+        ("client", query_client, repository_client),
+    ):
+        assert baseline() is cached()
+        base = min(timeit.repeat(baseline, number=iterations, repeat=3)) / iterations
+        fast = min(timeit.repeat(cached, number=iterations, repeat=3)) / iterations
+        print(f"{label:8} query API {base * 1e6:7.1f} us/call   lambda_stmt {fast * 1e6:7.1f} us/call   saved {(base - fast) * 1e6:6.1f} us ({(1 - fast / base) * 100:.0f}%)")
+
+if __name__ == "__main__":
+    main()
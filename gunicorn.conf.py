@@ -0,0 +1,58 @@
+import logging
+import multiprocessing
+import os
+import shutil
+
+# Production server: gunicorn managing uvicorn workers, with the app imported
+# once in the master (preload) and shared copy-on-write by the workers.
+#   gunicorn -c gunicorn.conf.py app.main:app
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# Graceful drain: on SIGTERM workers stop accepting and finish in-flight
+# requests for up to graceful_timeout seconds before being killed
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.environ.get("WORKER_TIMEOUT", "120"))
+keepalive = 5
+
+# Recycle workers periodically to bound per-worker memory growth
+max_requests = int(os.environ.get("MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", "200"))
+
+accesslog = "-"
+errorlog = "-"
+
+# Send the app's own loggers (app.lifecycle, app.timing, ...) to stderr too
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format="[%(asctime)s] [%(process)d] [%(levelname)s] %(name)s: %(message)s",
+)
+
+def on_starting(server):
+    # Prometheus multiprocess files from a previous run must not be aggregated
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    # Schema check runs once here instead of in every worker's lifespan
+    from app.database import all_engines, engine
+    from app.schema import check_schema
+    check_schema(engine)
+    for db_engine in all_engines():
+        db_engine.dispose()
+    os.environ["SCHEMA_CHECKED"] = "1"
+
+def post_fork(server, worker):
+    # Never share pooled connections opened in the master with a child
+    from app.database import all_engines
+    for db_engine in all_engines():
+        db_engine.dispose(close=False)
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)